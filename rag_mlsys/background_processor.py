@@ -1,11 +1,12 @@
 # background_processor.py
 import os
-import json
 import time
+import queue
 import threading
 from datetime import datetime
 from typing import Optional, Dict, Any
 from pathlib import Path
+import msgspec
 import core_processing
 import core_indexing
 
@@ -18,9 +19,35 @@ class TaskStatus:
     FAILED = "failed"        # 失败
 
 
+class TaskRecord(msgspec.Struct):
+    """任务状态的序列化结构（msgpack持久化用，字段与ProcessingTask.to_dict()对齐）"""
+    task_id: str
+    pdf_path: str
+    filename: str
+    session_id: str
+    status: str
+    progress: int
+    message: str
+    error: Optional[str]
+    db_path: Optional[str]
+    chunk_count: int
+    start_time: Optional[str]  # isoformat字符串
+    end_time: Optional[str]
+
+
+# 模块级编解码器（msgspec比stdlib json快1~2个数量级，状态文件写入不再是瓶颈）
+_ENC = msgspec.msgpack.Encoder()
+_DEC = msgspec.msgpack.Decoder(TaskRecord)
+
+
 class ProcessingTask:
     """PDF处理任务"""
-    
+
+    # __slots__省掉每个实例的__dict__，属性访问和to_record都更快
+    __slots__ = ("task_id", "pdf_path", "filename", "session_id", "status",
+                 "progress", "message", "error", "db_path", "chunk_count",
+                 "start_time", "end_time")
+
     def __init__(self, task_id: str, pdf_path: str, filename: str, session_id: str):
         self.task_id = task_id
         self.pdf_path = pdf_path
@@ -52,6 +79,23 @@ class ProcessingTask:
             "end_time": self.end_time.isoformat() if self.end_time else None
         }
 
+    def to_record(self) -> TaskRecord:
+        """转换为msgpack序列化结构"""
+        return TaskRecord(
+            task_id=self.task_id,
+            pdf_path=self.pdf_path,
+            filename=self.filename,
+            session_id=self.session_id,
+            status=self.status,
+            progress=self.progress,
+            message=self.message,
+            error=self.error,
+            db_path=self.db_path,
+            chunk_count=self.chunk_count,
+            start_time=self.start_time.isoformat() if self.start_time else None,
+            end_time=self.end_time.isoformat() if self.end_time else None
+        )
+
 
 class BackgroundProcessor:
     """后台处理器 - 单例模式"""
@@ -72,15 +116,29 @@ class BackgroundProcessor:
             return
         
         self.tasks = {}  # task_id -> ProcessingTask
+        self._tasks_lock = threading.RLock()  # API线程提交/轮询、worker线程处理并发访问
+        self._by_status = {
+            TaskStatus.PENDING: set(),
+            TaskStatus.PROCESSING: set(),
+            TaskStatus.COMPLETED: set(),
+            TaskStatus.FAILED: set(),
+        }  # status -> task_id集合，按状态查询O(1)
         self.task_dir = Path("./task_status")
         self.task_dir.mkdir(exist_ok=True)
         self.worker_thread = None
+        self._pending = queue.Queue()  # 待处理任务队列，submit_task入队即唤醒worker
+        self._last_save_ts = {}  # task_id -> 上次落盘的monotonic时间
+        self._embedding_model = None  # 懒加载，所有任务共享（BGE-large加载需几十秒）
+        self._embedding_lock = threading.Lock()
         self._initialized = True
     
     def submit_task(self, task: ProcessingTask) -> str:
         """提交一个新任务"""
-        self.tasks[task.task_id] = task
-        self._save_task_status(task)
+        with self._tasks_lock:
+            self.tasks[task.task_id] = task
+            self._by_status[task.status].add(task.task_id)
+        self._maybe_save(task, force=True)
+        self._pending.put(task)
         
         # 如果worker线程不存在或已结束，启动新的
         if self.worker_thread is None or not self.worker_thread.is_alive():
@@ -91,43 +149,45 @@ class BackgroundProcessor:
     
     def get_task_status(self, task_id: str) -> Optional[ProcessingTask]:
         """获取任务状态"""
-        if task_id in self.tasks:
-            return self.tasks[task_id]
+        with self._tasks_lock:
+            if task_id in self.tasks:
+                return self.tasks[task_id]
         
         # 尝试从文件加载
         return self._load_task_status(task_id)
+
+    def list_tasks_by_status(self, status: str) -> list:
+        """按状态列出任务（O(1)索引查询）"""
+        with self._tasks_lock:
+            return [self.tasks[tid] for tid in self._by_status.get(status, ()) if tid in self.tasks]
+
+    def _set_status(self, task: ProcessingTask, status: str):
+        """更新任务状态并维护按状态索引"""
+        with self._tasks_lock:
+            self._by_status.get(task.status, set()).discard(task.task_id)
+            task.status = status
+            self._by_status.setdefault(status, set()).add(task.task_id)
     
     def _worker(self):
         """后台工作线程"""
         while True:
-            # 查找待处理的任务
-            pending_task = None
-            for task in self.tasks.values():
-                if task.status == TaskStatus.PENDING:
-                    pending_task = task
-                    break
-            
-            if pending_task is None:
-                # 没有待处理任务，休眠后再检查
-                time.sleep(2)
-                continue
-            
-            # 处理任务
-            self._process_task(pending_task)
+            # 阻塞等待新任务，入队即被唤醒（不再轮询+sleep）
+            task = self._pending.get()
+            self._process_task(task)
     
     def _process_task(self, task: ProcessingTask):
         """处理单个任务"""
         try:
-            task.status = TaskStatus.PROCESSING
+            self._set_status(task, TaskStatus.PROCESSING)
             task.start_time = datetime.now()
             task.progress = 5
             task.message = "开始处理PDF..."
-            self._save_task_status(task)
+            self._maybe_save(task)
             
             # 步骤1: 处理PDF
             task.progress = 10
             task.message = "正在解析PDF文档..."
-            self._save_task_status(task)
+            self._maybe_save(task)
             
             chunks = core_processing.process_single_pdf(task.pdf_path, task.filename)
             
@@ -137,25 +197,15 @@ class BackgroundProcessor:
             task.chunk_count = len(chunks)
             task.progress = 50
             task.message = f"PDF解析完成，生成{len(chunks)}个文本块"
-            self._save_task_status(task)
+            self._maybe_save(task)
             
             # 步骤2: 创建向量数据库
             task.progress = 60
             task.message = "正在创建向量数据库..."
-            self._save_task_status(task)
-            
-            # 需要embedding模型（从session state获取）
-            # 注意：这里需要传入embedding模型
-            # 在实际使用时，需要从主线程传入
-            from langchain_huggingface import HuggingFaceEmbeddings
-            import torch
+            self._maybe_save(task)
             
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            embedding_model = HuggingFaceEmbeddings(
-                model_name="./models/bge-large-zh-v1.5",
-                model_kwargs={'device': device},
-                encode_kwargs={'normalize_embeddings': True}
-            )
+            # 复用常驻的embedding模型，避免每个PDF都重新加载
+            embedding_model = self._get_embedding_model()
             
             db_path, db_object = core_indexing.build_session_vector_db(
                 chunks,
@@ -167,54 +217,75 @@ class BackgroundProcessor:
             task.db_path = db_path
             task.progress = 100
             task.message = "处理完成！"
-            task.status = TaskStatus.COMPLETED
+            self._set_status(task, TaskStatus.COMPLETED)
             task.end_time = datetime.now()
             
-            self._save_task_status(task)
+            self._maybe_save(task, force=True)
             
             print(f"✅ 任务 {task.task_id} 处理完成")
             
         except Exception as e:
-            task.status = TaskStatus.FAILED
+            self._set_status(task, TaskStatus.FAILED)
             task.error = str(e)
             task.message = f"处理失败: {str(e)}"
             task.end_time = datetime.now()
-            self._save_task_status(task)
+            self._maybe_save(task, force=True)
             
             print(f"❌ 任务 {task.task_id} 处理失败: {e}")
     
+    def _get_embedding_model(self):
+        """获取共享的embedding模型（首次调用时加载，之后所有任务复用）"""
+        if self._embedding_model is None:
+            with self._embedding_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = core_indexing.initialize_embedding_model()
+        return self._embedding_model
+
+    # 进度更新的最小落盘间隔（秒），避免每个进度点都做一次磁盘写
+    _SAVE_INTERVAL = 0.25
+
+    def _maybe_save(self, task: ProcessingTask, force: bool = False):
+        """合并过于密集的状态写入，终态（完成/失败）强制落盘"""
+        if (not force
+                and task.status not in (TaskStatus.COMPLETED, TaskStatus.FAILED)
+                and time.monotonic() - self._last_save_ts.get(task.task_id, 0.0) < self._SAVE_INTERVAL):
+            return
+        self._save_task_status(task)
+        self._last_save_ts[task.task_id] = time.monotonic()
+
     def _save_task_status(self, task: ProcessingTask):
         """保存任务状态到文件"""
         try:
-            status_file = self.task_dir / f"{task.task_id}.json"
-            with open(status_file, 'w', encoding='utf-8') as f:
-                json.dump(task.to_dict(), f, ensure_ascii=False, indent=2)
+            status_file = self.task_dir / f"{task.task_id}.msgpack"
+            # 先写临时文件再原子替换，轮询方读不到半截数据
+            tmp_file = status_file.with_suffix(".msgpack.tmp")
+            tmp_file.write_bytes(_ENC.encode(task.to_record()))
+            os.replace(tmp_file, status_file)
         except Exception as e:
             print(f"⚠️ 保存任务状态失败: {e}")
-    
+
     def _load_task_status(self, task_id: str) -> Optional[ProcessingTask]:
         """从文件加载任务状态"""
         try:
-            status_file = self.task_dir / f"{task_id}.json"
+            status_file = self.task_dir / f"{task_id}.msgpack"
             if not status_file.exists():
                 return None
-            
-            with open(status_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
+
+            record = _DEC.decode(status_file.read_bytes())
+
             task = ProcessingTask(
-                task_id=data["task_id"],
-                pdf_path=data["pdf_path"],
-                filename=data["filename"],
-                session_id=data["session_id"]
+                task_id=record.task_id,
+                pdf_path=record.pdf_path,
+                filename=record.filename,
+                session_id=record.session_id
             )
-            task.status = data["status"]
-            task.progress = data["progress"]
-            task.message = data["message"]
-            task.error = data.get("error")
-            task.db_path = data.get("db_path")
-            task.chunk_count = data.get("chunk_count", 0)
-            
+            task.status = record.status
+            task.progress = record.progress
+            task.message = record.message
+            task.error = record.error
+            task.db_path = record.db_path
+            task.chunk_count = record.chunk_count
+
             return task
             
         except Exception as e:
@@ -1,19 +1,92 @@
 # core_indexing.py
+import itertools
 import os
 import pickle
+import queue
+import secrets
+import threading
 import uuid
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 from tqdm import tqdm
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 import torch
 import shutil
 
 EMBEDDING_MODEL_NAME = "./models/bge-large-zh-v1.5"
-BATCH_SIZE = 32
+BATCH_SIZE = 32  # 自动调优失败时的兜底值
 MAX_SEQ_LENGTH = 512
 
+# 进程内设备不会变，缓存探测结果（is_available每次都要碰CUDA驱动）
+_DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+_IS_CUDA = _DEVICE == 'cuda'
+
+# 首次加载后的权重快照：重启时mmap直读，跳过safetensors解析
+_WARM_CHECKPOINT = "./models/.bge_warm.pt"
+
+# 编码batch大小的自动调优（不同GPU/CPU的最优值差异可达2倍以上）
+_BATCH_CACHE_FILE = "./models/.batch_cache.json"
+_BATCH_CANDIDATES = [8, 16, 32, 64, 128]
+
+
+def _batch_cache_key(model_name: str) -> str:
+    """调优结果的缓存键：设备类型 + 模型 + 具体GPU型号"""
+    gpu_name = torch.cuda.get_device_name(0) if _IS_CUDA else ''
+    return f"{_DEVICE}|{model_name}|{gpu_name}"
+
+
+def _autotune_batch_size(embedding_model, sample_texts: List[str],
+                         model_name: str = EMBEDDING_MODEL_NAME) -> int:
+    """
+    扫一遍候选batch大小，选每条文本耗时最低的，结果按设备缓存到磁盘
+
+    Args:
+        embedding_model: embedding模型（需支持encode_kwargs，否则直接返回默认值）
+        sample_texts: 用于计时的样本文本
+        model_name: 模型路径（缓存键的一部分）
+
+    Returns:
+        最优batch大小（调优失败时返回BATCH_SIZE）
+    """
+    import json
+    import time
+
+    if not hasattr(embedding_model, 'encode_kwargs') or len(sample_texts) < 8:
+        return BATCH_SIZE
+
+    key = _batch_cache_key(model_name)
+    try:
+        with open(_BATCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if key in cache:
+            return cache[key]
+    except (FileNotFoundError, ValueError):
+        cache = {}
+
+    try:
+        best_bs, best_per_doc = BATCH_SIZE, float('inf')
+        sample = sample_texts[:128]
+        for bs in _BATCH_CANDIDATES:
+            embedding_model.encode_kwargs['batch_size'] = bs
+            start = time.perf_counter()
+            embedding_model.embed_documents(sample)
+            per_doc = (time.perf_counter() - start) / len(sample)
+            if per_doc < best_per_doc:
+                best_bs, best_per_doc = bs, per_doc
+
+        cache[key] = best_bs
+        os.makedirs(os.path.dirname(_BATCH_CACHE_FILE), exist_ok=True)
+        with open(_BATCH_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+
+        print(f"  ✓ batch大小调优完成: {best_bs}")
+        return best_bs
+    except Exception as e:
+        print(f"  ⚠️ batch大小调优失败，使用默认值{BATCH_SIZE}: {e}")
+        return BATCH_SIZE
+
 def build_session_vector_db(
     chunks: List[Document],
     session_id: str,
@@ -35,9 +108,13 @@ def build_session_vector_db(
     # 1. 定义会话专属的数据库路径
     session_db_path = os.path.join(base_db_path, f"session_{session_id}")
     
-    # 2. 清理旧数据库（如果存在）
+    # 2. 清理旧数据库（如果存在）：先原子重命名，再后台删除
+    # rename只改元数据，几乎瞬时；真正的rmtree在后台跑，不阻塞建库
     if os.path.exists(session_db_path):
-        shutil.rmtree(session_db_path)
+        trash_path = f"{session_db_path}.trash.{uuid.uuid4().hex}"
+        os.rename(session_db_path, trash_path)
+        threading.Thread(target=shutil.rmtree, args=(trash_path,),
+                         kwargs={'ignore_errors': True}, daemon=True).start()
         print(f"  清理旧数据库: {session_db_path}")
     
     os.makedirs(session_db_path, exist_ok=True)
@@ -51,18 +128,14 @@ def build_session_vector_db(
     else:
         print("  使用已加载的Embedding模型")
     
-    # 4. 预处理知识块
-    print(f"  预处理 {len(chunks)} 个知识块...")
-    filtered_chunks = filter_chunks(chunks)
-    processed_chunks = truncate_long_chunks(filtered_chunks)
-    print(f"  ✓ 预处理完成，保留 {len(processed_chunks)} 个有效片段")
-    
-    # 5. 创建向量数据库
-    print("  开始向量化...")
-    db = create_vector_db(processed_chunks, embedding_model, session_db_path)
-    
+    # 4+5. 流式预处理+向量化：chunk产出后立刻进入编码batch，
+    # 不再同时持有原始列表/过滤列表/截断列表三份数据
+    print(f"  预处理并向量化 {len(chunks)} 个知识块...")
+    db = create_vector_db(iter_preprocess(chunks), embedding_model, session_db_path)
+
+    indexed_count = db._collection.count()
     print(f"✓ 会话 [{session_id}] 的向量数据库创建成功！")
-    print(f"  共索引 {len(processed_chunks)} 个知识片段")
+    print(f"  共索引 {indexed_count} 个知识片段")
     
     return session_db_path, db
 
@@ -103,79 +176,204 @@ def load_session_vector_db(
     return db
 
 
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX Runtime INT8量化的embedding模型（CPU专用）
+
+    比CPU上的FP32 PyTorch快2~4倍（AVX-512 VNNI int8点积），模型体积约1/4。
+    接口与HuggingFaceEmbeddings兼容，可直接传给Chroma。
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        vectors = []
+        for i in range(0, len(texts), BATCH_SIZE):
+            batch = texts[i:i+BATCH_SIZE]
+            inputs = self.tokenizer(
+                batch, padding=True, truncation=True,
+                max_length=MAX_SEQ_LENGTH, return_tensors="np"
+            )
+            outputs = self.model(**inputs)
+            # CLS池化 + L2归一化（与BGE官方用法一致）
+            embeds = outputs.last_hidden_state[:, 0]
+            embeds = embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+            vectors.extend(embeds.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+
+class FastSentenceTransformerEmbeddings(Embeddings):
+    """
+    直连SentenceTransformer.encode的embedding封装
+
+    绕过HuggingFaceEmbeddings每次调用的包装开销，并尽量启用
+    BetterTransformer（融合MHA kernel，编码吞吐可提升数倍）。
+    接口与HuggingFaceEmbeddings兼容，可直接传给Chroma。
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, device: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+
+        device = device or _DEVICE
+        model_kwargs = {'torch_dtype': torch.bfloat16} if device == 'cuda' else {}
+        self.client = SentenceTransformer(model_name, device=device, model_kwargs=model_kwargs)
+
+        try:
+            from optimum.bettertransformer import BetterTransformer
+            self.client[0].auto_model = BetterTransformer.transform(self.client[0].auto_model)
+            print("  ✓ BetterTransformer已启用")
+        except Exception:
+            # 新版transformers原生集成SDPA后BetterTransformer已非必需
+            pass
+
+        try:
+            self._maybe_warm_start(device)
+        except Exception as e:
+            print(f"  ⚠️ 热启动快照不可用: {e}")
+
+        self.encode_kwargs = {'normalize_embeddings': True, 'batch_size': BATCH_SIZE}
+
+    def _maybe_warm_start(self, device: str):
+        """热启动：存在快照时用mmap加载的state dict原地替换参数，
+        否则把首次加载就位的权重存下来供下次启动用"""
+        auto_model = self.client[0].auto_model
+        if os.path.exists(_WARM_CHECKPOINT):
+            state = torch.load(_WARM_CHECKPOINT, map_location=device,
+                               weights_only=True, mmap=True)
+            auto_model.load_state_dict(state, assign=True)
+            print("  ✓ 从热启动快照恢复权重")
+        else:
+            # 换模型时需手动删除快照文件
+            torch.save(auto_model.state_dict(), _WARM_CHECKPOINT)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.client.encode(texts, convert_to_numpy=True, **self.encode_kwargs)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def initialize_onnx_embedding_model(model_name: str = EMBEDDING_MODEL_NAME) -> OnnxEmbeddings:
+    """
+    初始化ONNX Runtime INT8量化的embedding模型（CPU-only主机使用）
+
+    首次调用时导出并量化模型到 <model_name>/onnx_int8，之后直接复用。
+
+    Args:
+        model_name: 模型路径
+
+    Returns:
+        OnnxEmbeddings对象
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    quantized_dir = os.path.join(model_name, "onnx_int8")
+
+    if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+        print("  导出并量化ONNX模型（仅首次，约数分钟）...")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(quantized_dir)
+        quantizer = ORTQuantizer.from_pretrained(quantized_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=qconfig)
+
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        quantized_dir, file_name="model_quantized.onnx"
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    print("✓ ONNX INT8 Embedding模型加载成功")
+    return OnnxEmbeddings(model, tokenizer)
+
+
 def initialize_embedding_model(model_name: str = EMBEDDING_MODEL_NAME) -> HuggingFaceEmbeddings:
     """
     初始化Embedding模型（应该被@st.cache_resource缓存）
-    
+
     Args:
         model_name: 模型路径
-    
+
     Returns:
         HuggingFaceEmbeddings对象
     """
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    
+    device = _DEVICE
+
     print(f"初始化 Embedding 模型: {model_name}")
     print(f"  设备: {device}")
-    
+
+    if device == 'cpu':
+        # CPU走ONNX INT8路径；optimum不可用时退回FP32 PyTorch
+        try:
+            return initialize_onnx_embedding_model(model_name)
+        except ImportError:
+            print("  ⚠️ 未安装optimum[onnxruntime]，使用FP32 PyTorch")
+        except Exception as e:
+            print(f"  ⚠️ ONNX模型初始化失败，使用FP32 PyTorch: {e}")
+
     if device == 'cuda':
         print(f"  GPU: {torch.cuda.get_device_name(0)}")
         print(f"  可用显存: {(torch.cuda.get_device_properties(0).total_memory - torch.cuda.memory_allocated(0)) / 1024**3:.2f} GB")
-    
-    embedding_model = HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': device},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    
+
+    # 直连SentenceTransformer编码路径；失败时退回LangChain包装
+    try:
+        embedding_model = FastSentenceTransformerEmbeddings(model_name, device)
+    except Exception as e:
+        print(f"  ⚠️ 快速编码路径初始化失败，使用HuggingFaceEmbeddings: {e}")
+        model_kwargs = {'device': device}
+        if device == 'cuda':
+            # bfloat16权重使embedding计算和显存带宽减半，BGE-large精度损失可忽略
+            model_kwargs['model_kwargs'] = {'torch_dtype': torch.bfloat16}
+        embedding_model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs=model_kwargs,
+            encode_kwargs={'normalize_embeddings': True}
+        )
+
     print("✓ Embedding模型加载成功")
     return embedding_model
 
-def filter_chunks(chunks: List[Document]) -> List[Document]:
+def iter_preprocess(chunks: Iterable[Document], max_chars: int = MAX_SEQ_LENGTH * 2) -> Iterator[Document]:
     """
-    过滤知识块，移除不需要向量化的内容
-    """
-    original_count = len(chunks)
-    
-    # 只保留正文内容
-    filtered_chunks = [
-        chunk for chunk in chunks 
-        if chunk.metadata.get('page_type', 'content') == 'content'
-    ]
-    
-    filtered_count = len(filtered_chunks)
-    removed_count = original_count - filtered_count
-    
-    if removed_count > 0:
-        print(f"  过滤: 移除 {removed_count} 个非正文片段 ({removed_count/original_count*100:.1f}%)")
-    
-    return filtered_chunks
+    流式预处理：过滤非正文片段并截断过长片段，逐个yield
 
-
-def truncate_long_chunks(chunks: List[Document]) -> List[Document]:
-    """
-    截断过长的知识块
+    常见情况（正文且不超长）直接复用原Document，只有需要截断时才
+    构造新对象。生成器形式使原始chunks、过滤结果、截断结果不必
+    同时驻留内存——chunk产出后立刻进入编码batch。
     """
-    truncated = []
-    truncated_count = 0
-    max_chars = MAX_SEQ_LENGTH * 2
-    
     for chunk in chunks:
+        if chunk.metadata.get('page_type', 'content') != 'content':
+            continue
         if len(chunk.page_content) > max_chars:
-            chunk = chunk.copy(update={
-                "page_content": chunk.page_content[:max_chars] + "..."
-            })
-            chunk.metadata["truncated"] = True
-            truncated_count += 1
-        truncated.append(chunk)
-    
-    if truncated_count > 0:
-        print(f"  截断: {truncated_count} 个过长片段")
-    
-    return truncated
+            chunk = Document(
+                page_content=chunk.page_content[:max_chars] + "...",
+                metadata={**chunk.metadata, "truncated": True}
+            )
+        yield chunk
+
+
+def preprocess_chunks(chunks: List[Document], max_chars: int = MAX_SEQ_LENGTH * 2) -> List[Document]:
+    """单遍预处理（列表形式，流式场景请直接用iter_preprocess）"""
+    processed = list(iter_preprocess(chunks, max_chars))
+    removed_count = len(chunks) - len(processed)
+    if removed_count > 0:
+        print(f"  过滤: 移除 {removed_count} 个非正文片段 ({removed_count/len(chunks)*100:.1f}%)")
+    return processed
 
 def create_vector_db(
-    chunks: List[Document],
+    chunks: Iterable[Document],
     embedding_model: HuggingFaceEmbeddings,
     db_path: str
 ) -> Chroma:
@@ -183,7 +381,7 @@ def create_vector_db(
     创建向量数据库
     
     Args:
-        chunks: 知识块列表
+        chunks: 知识块列表或生成器（流式消费）
         embedding_model: embedding模型
         db_path: 数据库存储路径
     
@@ -191,62 +389,98 @@ def create_vector_db(
         Chroma数据库对象
     """
     try:
-        # 分批处理（避免内存溢出）
-        if len(chunks) > 500:
-            db = _create_db_in_batches(chunks, embedding_model, db_path)
-        else:
-            db = Chroma.from_documents(
-                documents=chunks,
-                embedding=embedding_model,
-                persist_directory=db_path,
-                collection_metadata={"hnsw:space": "cosine"}
-            )
-        
-        return db
-        
+        # 统一走分批流水线，列表和生成器都按批消费
+        return _create_db_in_batches(chunks, embedding_model, db_path)
     except Exception as e:
         print(f"  ✗ 创建向量数据库失败: {e}")
         raise
 
 
 def _create_db_in_batches(
-    chunks: List[Document],
+    chunks: Iterable[Document],
     embedding_model: HuggingFaceEmbeddings,
     db_path: str,
     batch_size: int = 500
 ) -> Chroma:
     """
-    分批创建向量数据库
+    分批创建向量数据库（chunks可为生成器，按批流式消费）
     """
-    db = None
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    
-    for i in tqdm(range(0, len(chunks), batch_size), desc="  向量化进度"):
-        batch = chunks[i:i+batch_size]
-        
-        # 确保每个文档有唯一ID
-        new_batch = [
-            Document(
-                page_content=d.page_content,
-                metadata={**d.metadata, "id": str(uuid.uuid4())}
-            )
-            for d in batch
-        ]
-        
-        if db is None:
-            db = Chroma.from_documents(
-                documents=new_batch,
-                embedding=embedding_model,
-                persist_directory=db_path,
-                collection_metadata={"hnsw:space": "cosine"}
-            )
-        else:
-            db.add_documents(new_batch)
-        
-        # 清理GPU缓存
-        if device == 'cuda':
+    chunk_iter = iter(chunks)
+    batch = list(itertools.islice(chunk_iter, batch_size))
+    if not batch:
+        raise ValueError("没有可索引的知识块")
+
+    # 按当前设备选最优的编码batch大小（用第一批做样本）
+    enc_bs = _autotune_batch_size(embedding_model, [c.page_content for c in batch])
+    if hasattr(embedding_model, 'encode_kwargs'):
+        embedding_model.encode_kwargs['batch_size'] = enc_bs
+
+    # 两级流水线：主线程编码第N+1批时，持久化线程并行写入第N批
+    # （Chroma/sqlite写盘时释放GIL，GPU不再等待HNSW插入）
+    write_queue = queue.Queue(maxsize=2)
+    persist_errors = []
+    persist_thread = None
+
+    try:
+        db = Chroma(
+            embedding_function=embedding_model,
+            persist_directory=db_path,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+
+        def _persist_worker():
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    break
+                try:
+                    db._collection.upsert(**item)
+                except Exception as e:
+                    persist_errors.append(e)
+
+        persist_thread = threading.Thread(target=_persist_worker, daemon=True)
+        persist_thread.start()
+
+        print(f"  编码片段 (batch={enc_bs})...")
+        progress = tqdm(desc="  向量化进度", unit="chunk")
+        while batch:
+            if persist_errors:
+                break
+            batch_texts = [chunk.page_content for chunk in batch]
+            try:
+                embeddings = embedding_model.embed_documents(batch_texts)
+            except torch.cuda.OutOfMemoryError:
+                # 显存不足：清缓存后逐条重试本批，后续batch减半而不是整个任务失败
+                torch.cuda.empty_cache()
+                if hasattr(embedding_model, 'encode_kwargs'):
+                    embedding_model.encode_kwargs['batch_size'] = 1
+                embeddings = embedding_model.embed_documents(batch_texts)
+                enc_bs = max(1, enc_bs // 2)
+                if hasattr(embedding_model, 'encode_kwargs'):
+                    embedding_model.encode_kwargs['batch_size'] = enc_bs
+                print(f"  ⚠️ 编码时显存不足，batch大小降为{enc_bs}")
+            write_queue.put({
+                "ids": [secrets.token_hex(16) for _ in batch],
+                "embeddings": embeddings,
+                "documents": batch_texts,
+                "metadatas": [chunk.metadata for chunk in batch]
+            })
+            progress.update(len(batch))
+            batch = list(itertools.islice(chunk_iter, batch_size))
+        progress.close()
+    finally:
+        # 异常路径（如embed_documents抛非OOM异常）也必须送哨兵并join，
+        # 否则持久化线程会永远阻塞在队列上泄漏
+        if persist_thread is not None:
+            write_queue.put(None)
+            persist_thread.join()
+        # 只在最后清理一次：empty_cache是同步调用，会阻塞CUDA流
+        if _IS_CUDA:
             torch.cuda.empty_cache()
-    
+
+    if persist_errors:
+        raise persist_errors[0]
+
     return db
 
 class OptimizedVectorDBBuilder:
@@ -263,16 +497,12 @@ class OptimizedVectorDBBuilder:
     def initialize_embedding_model(self):
         """初始化Embedding模型"""
         self.embedding_model = initialize_embedding_model(self.model_name)
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = _DEVICE
         return self.embedding_model
     
-    def filter_chunks(self, chunks: List[Document]) -> List[Document]:
-        """预过滤chunks"""
-        return filter_chunks(chunks)
-    
-    def truncate_long_chunks(self, chunks: List[Document]) -> List[Document]:
-        """截断过长chunks"""
-        return truncate_long_chunks(chunks)
+    def preprocess_chunks(self, chunks: List[Document]) -> List[Document]:
+        """预处理chunks（过滤+截断）"""
+        return preprocess_chunks(chunks)
     
     def create_vector_db(self, chunks: List[Document]) -> Chroma:
         """创建向量数据库"""
@@ -372,8 +602,7 @@ if __name__ == "__main__":
             print("✓ 已删除旧数据库")
     
     # 4. 预处理chunks
-    filtered_chunks = builder.filter_chunks(all_chunks)
-    processed_chunks = builder.truncate_long_chunks(filtered_chunks)
+    processed_chunks = builder.preprocess_chunks(all_chunks)
     
     # 5. 创建向量数据库
     db = builder.create_vector_db(processed_chunks)
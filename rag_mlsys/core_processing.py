@@ -1,9 +1,12 @@
 # core_processing.py
+import glob
+import itertools
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple
-from langchain_community.document_loaders import DirectoryLoader, PyMuPDFLoader
+from typing import Iterable, List, Optional, Tuple
+import fitz
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
@@ -12,6 +15,60 @@ CHAPTER_PATTERN = re.compile(
     r"(?:[\s　]*[：:．.\-—]*\s*(?P<title>[^\n\r，。：；、]{2,40}))?"
 )
 
+# 清洗/检测用的预编译正则（每页都会执行多次，模块级编译一次复用）
+_RE_CJK_SPACE = re.compile(r'(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])')
+_RE_THEOREM_MARK = re.compile(r'【(定理|引理|证明|推论|命题)[^】]*】')
+_RE_MULTI_NL = re.compile(r'\n{3,}')
+_RE_MULTI_SPACE = re.compile(r' {2,}')
+_RE_CHAPTER_HEADER = re.compile(r'^\s*第 \d+ 章.*?\n', re.MULTILINE)
+_RE_PAGE_NUM = re.compile(r'^\s*\d+\s*$', re.MULTILINE)
+_OCR_FIX_MAP = {'BA': '为', 'ME': '使', 'sk': '求'}
+
+# 内容页的独立替换规则融合成一个交替式：整页只扫一遍，
+# 替换逻辑在_fused_dispatch里按命中的分组分派。
+# CJK空格清理不能并入：定理分支的lookbehind必须看到去掉空格
+# 之后的文本（“根据 定理3.2”要先变成“根据定理3.2”才能打上标记），
+# 所以它保持为独立的第一遍扫描
+_RE_CONTENT_FUSED = re.compile(
+    r'(?P<formula>\(\s*(?P<fnum>\d+\.\d+)\s*\))'
+    r'|(?P<theorem>(?<![.\s])(?P<tword>定理|引理|证明|推论|命题)\s*(?P<tnum>\d+\.\d+)?(?!\s*\.))'
+    r'|(?P<ocr>\b(?:BA|ME|sk)\b)'
+    r'|(?P<mathop>[=≈≠≤≥<>])'
+)
+
+
+def _fused_dispatch(m: "re.Match") -> str:
+    group = m.lastgroup
+    if group == 'fnum' or group == 'formula':
+        return f"【公式{m.group('fnum')}】"
+    if group in ('theorem', 'tword', 'tnum'):
+        return f"\n\n【{m.group('tword')}{m.group('tnum') or ''}】\n"
+    if group == 'ocr':
+        return _OCR_FIX_MAP[m.group('ocr')]
+    return f" {m.group('mathop')} "
+
+# 页面类型检测
+_RE_TOC_DOTS = re.compile(r'\.\s*\.\s*\.\s*\.\s*\d+')
+_RE_TOC_LINE = re.compile(r'[\u4e00-\u9fff\w\s]+\.\s*\.\s*\.\s*\d+')
+_RE_GLOSSARY = re.compile(r'[\w\u4e00-\u9fff]+\s+\d+(,\s*\d+|–\d+){3,}')
+_RE_WORD_NUMBER = re.compile(r'\b[A-Za-z]+\s+[A-Za-z\s]+\d+')
+# 参考文献特征合并为单一可选分支；装了google-re2时用其DFA引擎
+# （逐行回溯正则是参考文献密集页的主要开销），否则退回内置re
+_REFERENCE_PATTERN = r'\[\d+\]\s*[A-Z]|et\s+al\.|\([12]\d{3}\)\.|^[A-Z][a-z]+,\s*[A-Z\.]'
+try:
+    import re2 as _re2
+    _RE_REFERENCE = _re2.compile(_REFERENCE_PATTERN)
+except ImportError:
+    _RE_REFERENCE = re.compile(_REFERENCE_PATTERN)
+
+# 分块合并/质量分析
+_RE_INCOMPLETE_TAIL = re.compile(r'[=+\-*/]$')
+_RE_CLAUSE_TAIL = re.compile(r'[，；,;]$')
+_RE_OPEN_BRACKET_TAIL = re.compile(r'[（([]$')
+_RE_INCOMPLETE_ANY = re.compile(r'[=+\-*/，,（(]$')
+# 质量分析：四类特征合一，单次扫描按lastgroup计数
+_RE_QUALITY = re.compile(r'(?P<formula>【公式)|(?P<theorem>【定理)|(?P<proof>【证明)|(?P<math>[=≈≠≤≥])')
+
 def _slugify(text: str) -> str:
     normalized = re.sub(r"\s+", "-", text.strip())
     normalized = re.sub(r"[^0-9A-Za-z\u4e00-\u9fff\-]+", "", normalized)
@@ -52,12 +109,17 @@ def extract_chapter_title(text: str) -> Optional[str]:
         return base
 
 
+def material_id_for_source(source_name: str) -> str:
+    """由来源文件名推导material_id（与向量metadata里打的标记完全一致）"""
+    return _slugify(Path(source_name).stem or "material") or "material"
+
+
 def _assign_chapter_metadata(
     chunks: List[Document],
     source_name: str,
 ) -> None:
     """Infer chapter metadata sequentially and annotate chunks in-place."""
-    material_id = _slugify(Path(source_name).stem or "material") or "material"
+    material_id = material_id_for_source(source_name)
     chapter_counter = 0
     current_chapter_id: Optional[str] = None
     current_title: Optional[str] = None
@@ -81,7 +143,7 @@ def _assign_page_chapter_metadata(
     pages: List[Document],
     source_name: str,
 ) -> None:
-    material_id = _slugify(Path(source_name).stem or "material") or "material"
+    material_id = material_id_for_source(source_name)
     chapter_counter = 0
     current_chapter_id: Optional[str] = None
     current_title: Optional[str] = None
@@ -103,14 +165,19 @@ def _assign_page_chapter_metadata(
             page.metadata.setdefault("chapter_id", current_chapter_id)
             page.metadata.setdefault("chapter_title", current_title)
 
-def process_single_pdf(pdf_path: str, source_name: Optional[str] = None) -> List[Document]:
+def process_single_pdf(
+    pdf_path: str,
+    source_name: Optional[str] = None,
+    parallel_clean: bool = True,
+) -> List[Document]:
     """
     处理单个PDF文件（核心函数，用于动态处理上传的文件）
-    
+
     Args:
-        pdf_path: PDF文件路径 
+        pdf_path: PDF文件路径
         source_name: 来源名称（用于元数据标记）
-    
+        parallel_clean: 清洗阶段是否允许开进程池（已在工作进程内时应关闭）
+
     Returns:
         List[Document]: 处理后的知识块列表
     """
@@ -120,24 +187,37 @@ def process_single_pdf(pdf_path: str, source_name: Optional[str] = None) -> List
     print(f"正在处理: {source_name}")
     
     try:
-        # 1. 加载PDF
-        loader = PyMuPDFLoader(pdf_path)
-        documents = loader.load()
-        print(f"  ✓ 成功加载 {len(documents)} 个页面")
-        
+        # 1. 加载PDF：直接用fitz遍历页面，绕过LangChain加载器的
+        # 逐页包装开销；完全无文本的页面（空白页、纯图页）当场跳过。
+        # 极短页面（如只有“第6章 …”的章首页）此时还要保留——章节
+        # 归属要靠它们确定过渡点，过滤放到元数据标注之后
+        documents = []
+        with fitz.open(pdf_path) as pdf:
+            total_pages = pdf.page_count
+            for page_index, page in enumerate(pdf):
+                text = page.get_text("text")
+                if text.strip():
+                    documents.append(Document(
+                        page_content=text,
+                        metadata={"source": pdf_path, "page": page_index},
+                    ))
+
         _assign_page_chapter_metadata(documents, source_name)
+        # 章节过渡已记录，短页（封面、章首页）不必进入清洗/分块
+        documents = [d for d in documents if len(d.page_content.strip()) > 100]
+        print(f"  ✓ 成功加载 {total_pages} 个页面，保留 {len(documents)} 个有效页面")
         # 2. 清洗文档
-        cleaned_documents = clean_document_content(documents)
+        cleaned_documents = clean_document_content(documents, parallel=parallel_clean)
         print(f"  ✓ 清洗完成，保留 {len(cleaned_documents)} 个有效页面")
         
         # 3. 文本分块
         all_chunks = split_text_into_chunks(cleaned_documents)
         print(f"  ✓ 分块完成，生成 {len(all_chunks)} 个知识片段")
         
-        # 4. 添加来源与章节元数据
+        # 4. 添加来源与章节元数据（补丁字典构造一次，逐块走dict.update的C路径）
+        meta_patch = {'source': source_name, 'original_path': pdf_path}
         for chunk in all_chunks:
-            chunk.metadata['source'] = source_name
-            chunk.metadata['original_path'] = pdf_path
+            chunk.metadata.update(meta_patch)
         _assign_chapter_metadata(all_chunks, source_name)
         
         return all_chunks
@@ -147,6 +227,11 @@ def process_single_pdf(pdf_path: str, source_name: Optional[str] = None) -> List
         return []
 
 
+def _process_pdf_in_worker(pdf_path: str) -> List[Document]:
+    """进程池工作函数：保留原始路径作为source元数据，并关闭内层清洗池"""
+    return process_single_pdf(pdf_path, source_name=pdf_path, parallel_clean=False)
+
+
 def process_directory(directory_path: str) -> List[Document]:
     """
     批量处理目录下的所有PDF（保留原有功能）
@@ -159,93 +244,109 @@ def process_directory(directory_path: str) -> List[Document]:
     """
     print(f"正在从 '{directory_path}' 批量加载PDF文件...")
     
-    # 使用目录加载器
-    loader = DirectoryLoader(
-        directory_path,
-        glob="**/*.pdf",
-        loader_cls=PyMuPDFLoader,
-        show_progress=True,
-        use_multithreading=True
-    )
+    pdf_files = sorted(glob.glob(os.path.join(directory_path, "**", "*.pdf"), recursive=True))
+    if not pdf_files:
+        print("未找到PDF文件")
+        return []
+    
+    # 每个PDF在独立进程里完成 加载+清洗+分块 全流程
+    # （正则清洗是持有GIL的纯Python计算，线程并发无加速）。
+    # source必须保留glob给出的相对路径：内置教材过滤、章节索引
+    # 都按 knowledge_base/xx.pdf 这样的路径匹配，不能退化成basename
+    max_workers = min(len(pdf_files), os.cpu_count() or 1)
+    if len(pdf_files) > 1 and max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_process_pdf_in_worker, pdf_files)
+            all_chunks = list(itertools.chain.from_iterable(results))
+    else:
+        # 单文件或单核环境：串行处理全部文件，不丢任何一个
+        all_chunks = list(itertools.chain.from_iterable(
+            process_single_pdf(p, source_name=p) for p in pdf_files
+        ))
     
-    documents = loader.load()
-    print(f"成功加载了 {len(documents)} 个页面。")
+    print(f"成功生成 {len(all_chunks)} 个知识片段。")
+    return all_chunks
 
-    for page in documents:
-        source_name = page.metadata.get("source") or os.path.basename(directory_path)
-        _assign_page_chapter_metadata([page], source_name)
+def _clean_one(doc: Document) -> Optional[Document]:
+    """清洗单个页面，内容过短时返回None"""
+    text = doc.page_content
+    
+    # 预先检测页面类型
+    page_type = 'content'
+    if is_table_of_contents(text):
+        page_type = 'toc'
+        doc.metadata['page_type'] = 'table_of_contents'
+    elif is_glossary_or_index(text):
+        page_type = 'glossary'
+        doc.metadata['page_type'] = 'glossary'
+    elif is_reference_page(text):
+        page_type = 'reference'
+        doc.metadata['page_type'] = 'reference'
+    else:
+        doc.metadata['page_type'] = 'content'
     
-    # 清洗和分块
-    cleaned_documents = clean_document_content(documents)
-    all_chunks = split_text_into_chunks(cleaned_documents)
+    # 清洗规则：先去CJK空格（定理检测依赖它），再对内容页做融合单遍扫描
+    text = _RE_CJK_SPACE.sub('', text)
+    if page_type == 'content':
+        text = _RE_CONTENT_FUSED.sub(_fused_dispatch, text)
+    elif page_type == 'toc':
+        text = _RE_THEOREM_MARK.sub('', text)
     
-    return all_chunks
+    # 空白归一化依赖第一遍插入的换行/空格，保留为第二遍
+    text = _RE_MULTI_NL.sub('\n\n', text)
+    text = _RE_MULTI_SPACE.sub(' ', text)
+    text = _RE_CHAPTER_HEADER.sub('', text)
+    text = _RE_PAGE_NUM.sub('', text)
+    
+    doc.page_content = text.strip()
+    
+    # 过滤过短内容
+    if len(doc.page_content) > 100:
+        return doc
+    return None
+
 
-def clean_document_content(documents: List[Document]) -> List[Document]:
+# 页面数低于该值时进程池的启动/pickle开销得不偿失
+_PARALLEL_CLEAN_THRESHOLD = 32
+
+
+def clean_document_content(documents: List[Document], parallel: bool = True) -> List[Document]:
     """
-    对文档内容进行增强清洗
+    对文档内容进行增强清洗（页面相互独立，页数多时进程池并行）。
+
+    parallel=False用于已经在process_directory工作进程内的场景：
+    3.9+的池工作进程是非守护进程，嵌套建池不会报错，而是悄悄
+    fan-out到 n_files×n_cpu 个进程外加双向逐页pickle。
     """
     print("开始清洗文档内容...")
-    cleaned_documents = []
-    
-    for doc in documents:
-        text = doc.page_content
-        
-        # 预先检测页面类型
-        page_type = 'content'
-        if is_table_of_contents(text):
-            page_type = 'toc'
-            doc.metadata['page_type'] = 'table_of_contents'
-        elif is_glossary_or_index(text):
-            page_type = 'glossary'
-            doc.metadata['page_type'] = 'glossary'
-        elif is_reference_page(text):
-            page_type = 'reference'
-            doc.metadata['page_type'] = 'reference'
-        else:
-            doc.metadata['page_type'] = 'content'
-        
-        # 清洗规则
-        text = re.sub(r'(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])', '', text)
-        
-        if page_type == 'content':
-            text = re.sub(r'\(\s*(\d+\.\d+)\s*\)', r'【公式\1】', text)
-            text = re.sub(r'(?<![.\s])(定理|引理|证明|推论|命题)\s*(\d+\.\d+)?(?!\s*\.)', 
-                         r'\n\n【\1\2】\n', text)
-        
-        if page_type == 'toc':
-            text = re.sub(r'【(定理|引理|证明|推论|命题)[^】]*】', '', text)
-        
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        
-        if page_type == 'content':
-            ocr_fixes = {'BA': '为', 'ME': '使', 'sk': '求'}
-            for wrong, correct in ocr_fixes.items():
-                text = re.sub(rf'\b{wrong}\b', correct, text)
-            text = re.sub(r'([=≈≠≤≥<>])', r' \1 ', text)
-        
-        text = re.sub(r' {2,}', ' ', text)
-        text = re.sub(r'^\s*第 \d+ 章.*?\n', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
-        
-        doc.page_content = text.strip()
-        
-        # 过滤过短内容
-        if len(doc.page_content) > 100:
-            cleaned_documents.append(doc)
+
+    if not parallel or len(documents) < _PARALLEL_CLEAN_THRESHOLD:
+        cleaned_documents = [d for d in map(_clean_one, documents) if d is not None]
+    else:
+        try:
+            with ProcessPoolExecutor() as executor:
+                cleaned_documents = [
+                    d for d in executor.map(_clean_one, documents, chunksize=16)
+                    if d is not None
+                ]
+        except Exception:
+            # 受限环境（如已在子进程中）退回串行
+            cleaned_documents = [d for d in map(_clean_one, documents) if d is not None]
     
     print(f"清洗完成。剩余 {len(cleaned_documents)} 个有效页面。")
     return cleaned_documents
 
 def is_table_of_contents(text: str) -> bool:
     """检测目录页"""
-    dots_pattern = r'\.\s*\.\s*\.\s*\.\s*\d+'
-    matches = re.findall(dots_pattern, text)
+    # 廉价子串筛查：没有点线引导符的页面直接放行，不进正则引擎
+    if '..' not in text and '. .' not in text:
+        return False
+    
+    matches = _RE_TOC_DOTS.findall(text)
     if len(matches) > 5:
         return True
     
-    toc_pattern = r'[\u4e00-\u9fff\w\s]+\.\s*\.\s*\.\s*\d+'
-    toc_matches = re.findall(toc_pattern, text)
+    toc_matches = _RE_TOC_LINE.findall(text)
     if len(toc_matches) > 5:
         return True
     
@@ -254,13 +355,13 @@ def is_table_of_contents(text: str) -> bool:
 
 def is_glossary_or_index(text: str) -> bool:
     """检测词汇表或索引页"""
-    pattern = r'[\w\u4e00-\u9fff]+\s+\d+(,\s*\d+|–\d+){3,}'
-    matches = re.findall(pattern, text)
-    if len(matches) > 10:
-        return True
+    # 页码列表模式必然带逗号/连接号，缺了就跳过这条正则
+    if ',' in text or '–' in text:
+        matches = _RE_GLOSSARY.findall(text)
+        if len(matches) > 10:
+            return True
     
-    word_number_pattern = r'\b[A-Za-z]+\s+[A-Za-z\s]+\d+'
-    word_matches = re.findall(word_number_pattern, text)
+    word_matches = _RE_WORD_NUMBER.findall(text)
     if len(word_matches) > 15:
         return True
     
@@ -269,18 +370,22 @@ def is_glossary_or_index(text: str) -> bool:
 
 def is_reference_page(text: str) -> bool:
     """检测参考文献页"""
-    reference_patterns = [
-        r'\[\d+\]\s*[A-Z]',
-        r'et\s+al\.',
-        r'\([12]\d{3}\)\.',
-        r'^[A-Z][a-z]+,\s*[A-Z\.]',
-    ]
+    # 四种标志（编号[]、et al、年份括号、"姓, 名首字母"作者行）都
+    # 不可能出现的页面直接放行；作者行模式必然带英文逗号，
+    # 所以逗号也要参与筛查，否则该模式永远走不到正则
+    if (
+        '[' not in text
+        and 'et al' not in text
+        and '(' not in text
+        and ',' not in text
+    ):
+        return False
     
     matches = 0
     lines = text.split('\n')
     
     for line in lines:
-        if any(re.search(p, line.strip()) for p in reference_patterns):
+        if _RE_REFERENCE.search(line.strip()):
             matches += 1
     
     if len(lines) > 0:
@@ -320,64 +425,73 @@ def split_text_into_chunks(documents: List[Document]) -> List[Document]:
         length_function=len,
     )
     
-    all_chunks = text_splitter.split_documents(documents)
-    all_chunks = post_process_chunks(all_chunks)
-    
+    # 已短于阈值的页面直接作为单块透传：递归分隔符扫描对它们
+    # 毫无收益（阈值略低于chunk_size，给后续合并留余量）
+    _PASS_THROUGH_LIMIT = 900
+
+    def _iter_split():
+        for doc in documents:
+            if len(doc.page_content) <= _PASS_THROUGH_LIMIT:
+                yield doc
+            else:
+                yield from text_splitter.split_documents([doc])
+
+    all_chunks = post_process_chunks(_iter_split())
+
     print(f"成功将文档切分为 {len(all_chunks)} 个知识片段。")
     return all_chunks
 
 
-def post_process_chunks(chunks: List[Document]) -> List[Document]:
-    """后处理分块结果"""
-    processed_chunks = []
-    skip_next = False
-    
-    for i in range(len(chunks)):
-        if skip_next:
-            skip_next = False
-            continue
-        
-        current_chunk = chunks[i]
-        content = current_chunk.page_content.strip()
-        
+def post_process_chunks(chunks: Iterable[Document]) -> List[Document]:
+    """后处理分块结果（单遍流式扫描，用一格前瞻代替索引回看）"""
+    processed_chunks: List[Document] = []
+    pending: Optional[Document] = None  # 等待确认是否与下一块合并的块
+    pending_type = 'content'
+
+    for chunk in chunks:
+        # page_type每块只查一次，后面所有判断复用
+        page_type = chunk.metadata.get('page_type', 'content')
+
+        if pending is not None:
+            if (pending_type == 'content' and page_type == 'content'
+                    and should_merge_with_next(pending.page_content, chunk.page_content)):
+                # 合并后立即输出，当前块被吸收
+                pending.page_content = pending.page_content.strip() + "\n" + chunk.page_content
+                processed_chunks.append(pending)
+                pending = None
+                continue
+            processed_chunks.append(pending)
+            pending = None
+
         # 过滤过短片段
-        if len(content) < 100:
+        if len(chunk.page_content.strip()) < 100:
             continue
-        
-        page_type = current_chunk.metadata.get('page_type', 'content')
-        
+
         if page_type != 'content':
-            current_chunk.metadata['is_special_page'] = True
-        
-        # 检查是否需要合并
-        if i < len(chunks) - 1 and page_type == 'content':
-            next_chunk = chunks[i + 1]
-            next_page_type = next_chunk.metadata.get('page_type', 'content')
-            
-            if next_page_type == 'content':
-                if should_merge_with_next(content, next_chunk.page_content):
-                    merged_content = content + "\n" + next_chunk.page_content
-                    current_chunk.page_content = merged_content
-                    skip_next = True
-        
-        processed_chunks.append(current_chunk)
-    
+            chunk.metadata['is_special_page'] = True
+
+        pending = chunk
+        pending_type = page_type
+
+    if pending is not None:
+        processed_chunks.append(pending)
+
     return processed_chunks
 
 
 def should_merge_with_next(current_content: str, next_content: str) -> bool:
     """判断是否应该与下一块合并"""
-    if re.search(r'[=+\-*/]$', current_content.strip()):
+    if _RE_INCOMPLETE_TAIL.search(current_content.strip()):
         return True
     
-    if re.search(r'[，；,;]$', current_content.strip()):
+    if _RE_CLAUSE_TAIL.search(current_content.strip()):
         return True
     
     if '【证明' in current_content and '证毕' not in current_content:
         if not next_content.strip().startswith('【'):
             return True
     
-    if re.search(r'[（([]$', current_content.strip()):
+    if _RE_OPEN_BRACKET_TAIL.search(current_content.strip()):
         return True
     
     return False
@@ -399,20 +513,20 @@ def analyze_chunk_quality(chunks: List[Document]) -> dict:
         'content_chunks': 0,
     }
     
-    total_length = 0
-    incomplete_patterns = [
-        r'[=+\-*/]$',
-        r'[，,]$',
-        r'[（(]$',
-    ]
+    if chunks:
+        # 长度统计交给numpy，避免逐块的Python级min/max/累加
+        import numpy as np
+        lengths = np.fromiter(
+            (len(c.page_content) for c in chunks), dtype=np.int64, count=len(chunks)
+        )
+        stats['min_length'] = int(lengths.min())
+        stats['max_length'] = int(lengths.max())
+        stats['avg_length'] = float(lengths.mean())
+    else:
+        stats['avg_length'] = 0
     
     for chunk in chunks:
         content = chunk.page_content
-        length = len(content)
-        
-        total_length += length
-        stats['min_length'] = min(stats['min_length'], length)
-        stats['max_length'] = max(stats['max_length'], length)
         
         page_type = chunk.metadata.get('page_type', 'content')
         if page_type == 'table_of_contents':
@@ -424,20 +538,23 @@ def analyze_chunk_quality(chunks: List[Document]) -> dict:
         else:
             stats['content_chunks'] += 1
             
-            if '【公式' in content or re.search(r'[=≈≠≤≥]', content):
-                stats['formula_chunks'] += 1
+            # 一次扫描找齐四类特征，全部命中即提前退出
+            found = set()
+            for m in _RE_QUALITY.finditer(content):
+                found.add(m.lastgroup)
+                if len(found) == 4:
+                    break
             
-            if '【定理' in content:
+            if 'formula' in found or 'math' in found:
+                stats['formula_chunks'] += 1
+            if 'theorem' in found:
                 stats['theorem_chunks'] += 1
-            
-            if '【证明' in content:
+            if 'proof' in found:
                 stats['proof_chunks'] += 1
             
-            if any(re.search(pattern, content.strip()) for pattern in incomplete_patterns):
+            if _RE_INCOMPLETE_ANY.search(content.strip()):
                 stats['incomplete_chunks'] += 1
     
-    stats['avg_length'] = total_length / len(chunks) if chunks else 0
-    
     return stats
 
 
@@ -467,12 +584,12 @@ def print_quality_report(stats: dict):
 
 def save_chunks_to_file(chunks: List[Document], output_dir: str = "./processed_chunks"):
     """保存知识块到文件"""
-    import json
+    import orjson
     import pickle
     
     os.makedirs(output_dir, exist_ok=True)
     
-    # 保存为JSON
+    # 保存为JSON（orjson直接输出bytes，比stdlib编码器快一个量级）
     chunks_data = []
     for i, chunk in enumerate(chunks):
         chunks_data.append({
@@ -482,8 +599,8 @@ def save_chunks_to_file(chunks: List[Document], output_dir: str = "./processed_c
         })
     
     json_path = os.path.join(output_dir, "chunks.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(chunks_data, f, ensure_ascii=False, indent=2)
+    with open(json_path, 'wb') as f:
+        f.write(orjson.dumps(chunks_data, option=orjson.OPT_INDENT_2))
     print(f"✓ JSON格式已保存到: {json_path}")
     
     # 保存为Pickle
@@ -6,10 +6,13 @@
 
 from __future__ import annotations
 
-import json
+import mmap
+import os
 import re
 import uuid
-from collections import Counter
+
+import orjson
+from collections import Counter, defaultdict
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
@@ -18,6 +21,12 @@ ANALYTICS_DIR = Path("./analytics")
 QUIZ_HISTORY_FILE = ANALYTICS_DIR / "quiz_history.json"
 MAX_HISTORY = 200
 
+# derive_concept_key每题都会调用，空白归一化的正则编译一次
+_RE_WS = re.compile(r"\s+")
+# 关键词提取用的词形正则
+_RE_ZH_TERM = re.compile(r"[\u4e00-\u9fff]{2,}")
+_RE_EN_TERM = re.compile(r"[A-Za-z]{3,}")
+
 
 def derive_concept_key(question: Dict[str, Any]) -> str:
     """
@@ -37,7 +46,7 @@ def derive_concept_key(question: Dict[str, Any]) -> str:
         or question.get("question")
         or ""
     )
-    snippet_norm = re.sub(r"\s+", " ", snippet).strip().lower()[:160]
+    snippet_norm = _RE_WS.sub(" ", snippet).strip().lower()[:160]
     if not snippet_norm:
         snippet_norm = "no_snippet"
     return "|".join([source, chapter, page, snippet_norm])
@@ -47,30 +56,96 @@ def _ensure_dir() -> None:
     ANALYTICS_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# 进程内历史缓存：文件mtime不变就不重新解析
+_HISTORY_CACHE: Optional[List[Dict[str, Any]]] = None
+_HISTORY_MTIME: float = 0.0
+
+
 def load_quiz_history(limit: Optional[int] = None) -> List[Dict[str, Any]]:
     """加载测验历史，按时间升序返回"""
+    global _HISTORY_CACHE, _HISTORY_MTIME
+
     _ensure_dir()
     if not QUIZ_HISTORY_FILE.exists():
         return []
+
+    mtime = QUIZ_HISTORY_FILE.stat().st_mtime
+    if _HISTORY_CACHE is not None and mtime == _HISTORY_MTIME:
+        return _HISTORY_CACHE[-limit:] if limit else list(_HISTORY_CACHE)
     
     try:
-        with open(QUIZ_HISTORY_FILE, "r", encoding="utf-8") as f:
-            history = json.load(f)
-            if not isinstance(history, list):
-                history = []
+        # mmap避免把整个文件先拷贝进Python层再解析，
+        # orjson直接消费buffer里的字节
+        with open(QUIZ_HISTORY_FILE, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                head = mm[:16].lstrip()
+                if head.startswith(b"["):
+                    # 兼容旧版整文件JSON数组格式
+                    history = orjson.loads(mm[:])
+                    if not isinstance(history, list):
+                        history = []
+                else:
+                    # 追加式JSONL：逐行扫描mmap缓冲，一行一条记录
+                    history = [
+                        orjson.loads(line)
+                        for line in iter(mm.readline, b"")
+                        if line.strip()
+                    ]
     except Exception:
         history = []
     
     history.sort(key=lambda x: x.get("timestamp", ""))
+    _HISTORY_CACHE = history
+    _HISTORY_MTIME = mtime
     if limit:
         return history[-limit:]
-    return history
+    return list(history)
+
+
+# material_id -> 历史记录 的反向索引，随历史缓存一起失效；
+# 按教材过滤从每请求O(N)扫描变为一次字典查找
+_BY_MATERIAL: Optional[Dict[str, List[Dict[str, Any]]]] = None
+_BY_MATERIAL_MTIME: float = -1.0
+
+
+def load_history_for_material(
+    material_id: str, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """按教材加载测验历史（时间升序），走缓存的反向索引"""
+    global _BY_MATERIAL, _BY_MATERIAL_MTIME
+
+    history = load_quiz_history()
+    if _BY_MATERIAL is None or _BY_MATERIAL_MTIME != _HISTORY_MTIME:
+        index: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for entry in history:
+            mid = entry.get("material_id")
+            if mid:
+                index[mid].append(entry)
+        _BY_MATERIAL = dict(index)
+        _BY_MATERIAL_MTIME = _HISTORY_MTIME
+
+    entries = _BY_MATERIAL.get(material_id, [])
+    return entries[-limit:] if limit else list(entries)
 
 
 def _save_history(history: List[Dict[str, Any]]) -> None:
+    """全量重写为JSONL（仅在压缩/截断时调用）"""
     _ensure_dir()
-    with open(QUIZ_HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+    with open(QUIZ_HISTORY_FILE, "wb") as f:
+        for entry in history:
+            f.write(orjson.dumps(entry))
+            f.write(b"\n")
+
+
+def _append_entry(entry: Dict[str, Any]) -> None:
+    """追加单条记录，不重写既有历史"""
+    _ensure_dir()
+    with open(QUIZ_HISTORY_FILE, "ab") as f:
+        f.write(orjson.dumps(entry))
+        f.write(b"\n")
 
 
 def record_quiz_attempt(report: Dict[str, Any], metadata: Dict[str, Any]) -> Dict[str, Any]:
@@ -129,8 +204,19 @@ def record_quiz_attempt(report: Dict[str, Any], metadata: Dict[str, Any]) -> Dic
         "questions": questions,
     }
     history.append(entry)
-    history = history[-MAX_HISTORY:]
-    _save_history(history)
+    if len(history) > MAX_HISTORY:
+        # 超过上限才整文件压缩重写，平时只追加一行
+        _save_history(history[-MAX_HISTORY:])
+    elif QUIZ_HISTORY_FILE.exists() and QUIZ_HISTORY_FILE.read_bytes().lstrip().startswith(b"["):
+        # 旧版数组格式：借这次写入迁移为JSONL
+        _save_history(history)
+    else:
+        _append_entry(entry)
+
+    # 写入后同步缓存，下次load无需重新解析
+    global _HISTORY_CACHE, _HISTORY_MTIME
+    _HISTORY_CACHE = history[-MAX_HISTORY:]
+    _HISTORY_MTIME = QUIZ_HISTORY_FILE.stat().st_mtime
     return entry
 
 
@@ -185,10 +271,9 @@ def _extract_keywords(report: Dict[str, Any], max_terms: int = 6) -> List[str]:
     tokens: Counter = Counter()
     for item in wrong_questions:
         text = item.get("question", "")
-        zh_terms = re.findall(r"[\u4e00-\u9fff]{2,}", text)
-        en_terms = re.findall(r"[A-Za-z]{3,}", text)
-        for term in zh_terms + en_terms:
-            tokens[term] += 1
+        # Counter.update走C实现的计数循环
+        tokens.update(_RE_ZH_TERM.findall(text))
+        tokens.update(_RE_EN_TERM.findall(text))
     most_common = [term for term, _ in tokens.most_common(max_terms)]
     return most_common
 
@@ -218,10 +303,10 @@ def collect_wrong_questions(
     题目标识 key = (stem/question 文本, source, page)。
     """
 
-    # key -> 最近一次是否答对
-    latest_status: Dict[str, bool] = {}
-    # key -> 最近一次作答的完整题目数据（用于返回）
-    latest_detail: Dict[str, Dict[str, Any]] = {}
+    # key -> 最近一次作答的完整题目数据（is_correct就在值里，单表即可）
+    latest: Dict[str, Dict[str, Any]] = {}
+    # 同一题目对象在多次调用derive_concept_key间复用结果（内部有正则+lower）
+    key_cache: Dict[int, str] = {}
 
     # 假设 load_quiz_history 返回的 history 是按时间顺序排列（最早在前，最近在后）
     # 这样后面的记录会覆盖前面的记录，最终保留“最近一次”的状态
@@ -234,22 +319,18 @@ def collect_wrong_questions(
             if chapter_id and q.get("chapter_id") != chapter_id:
                 continue
 
-            stem = q.get("stem") or q.get("question") or ""
-            source = q.get("source")
-            page = q.get("page")
+            key = key_cache.get(id(q))
+            if key is None:
+                key = derive_concept_key(q)
+                key_cache[id(q)] = key
 
-            key = derive_concept_key(q)
-            is_correct = bool(q.get("is_correct"))
-
-            latest_status[key] = is_correct
-            latest_detail[key] = q
+            latest[key] = q
 
     wrong_items: List[Dict[str, Any]] = []
-    for key, is_correct in latest_status.items():
-        if is_correct:
-            continue  
+    for key, q in latest.items():
+        if q.get("is_correct"):
+            continue
 
-        q = latest_detail[key].copy()
         wrong_items.append(
             {
                 "concept_key": q.get("concept_key") or key,
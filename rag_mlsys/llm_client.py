@@ -1,6 +1,9 @@
 # llm_client.py
+import asyncio
+import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any
 
 from dotenv import load_dotenv  
@@ -16,6 +19,15 @@ class LLMClientError(RuntimeError):
     pass
 
 
+# 复用连接池：避免每次调用都重建TCP+TLS连接（一次握手100~300ms）
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2))
+
+# 异步客户端懒初始化（批量出题/判卷等多请求场景并发发起I/O）
+_ASYNC_CLIENT = None
+
+
 def _get_headers() -> Dict[str, str]:
     if not LLM_API_KEY:
         raise LLMClientError("未配置环境变量 LLM_API_KEY（请在根目录 .env 中设置你的 ModelScope Token）")
@@ -25,12 +37,12 @@ def _get_headers() -> Dict[str, str]:
     }
 
 
-def chat_completion(
+def _build_payload(
     messages: List[Dict[str, str]],
-    temperature: float = 0.7,
-    max_tokens: int = 1024,
-    extra_params: Dict[str, Any] | None = None,
-) -> str:
+    temperature: float,
+    max_tokens: int,
+    extra_params: Dict[str, Any] | None,
+) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
         "model": LLM_MODEL,
         "messages": messages,
@@ -39,14 +51,118 @@ def chat_completion(
     }
     if extra_params:
         payload.update(extra_params)
+    return payload
 
-    url = f"{LLM_API_BASE}/chat/completions"
-    resp = requests.post(url, headers=_get_headers(), json=payload, timeout=60)
-    if resp.status_code != 200:
-        raise LLMClientError(f"LLM API 调用失败: {resp.status_code} {resp.text}")
 
-    data = resp.json()
+def _parse_response(data: Dict[str, Any]) -> str:
     try:
         return data["choices"][0]["message"]["content"]
     except Exception as e:
         raise LLMClientError(f"解析 LLM 返回数据失败: {e}, 原始返回: {data}")
+
+
+def chat_completion(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    max_tokens: int = 1024,
+    extra_params: Dict[str, Any] | None = None,
+) -> str:
+    payload = _build_payload(messages, temperature, max_tokens, extra_params)
+
+    url = f"{LLM_API_BASE}/chat/completions"
+    resp = _SESSION.post(url, headers=_get_headers(), json=payload, timeout=60)
+    if resp.status_code != 200:
+        raise LLMClientError(f"LLM API 调用失败: {resp.status_code} {resp.text}")
+
+    return _parse_response(resp.json())
+
+
+def chat_completion_stream(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    max_tokens: int = 1024,
+    extra_params: Dict[str, Any] | None = None,
+):
+    """
+    chat_completion的流式版本：按SSE增量逐段产出回复文本。
+    首段文本在prefill结束后立刻可见，不必等整个1024-token生成完。
+
+    生成器用法：for delta in chat_completion_stream(...): ...
+    """
+    payload = _build_payload(messages, temperature, max_tokens, extra_params)
+    payload["stream"] = True
+
+    url = f"{LLM_API_BASE}/chat/completions"
+    resp = _SESSION.post(
+        url, headers=_get_headers(), json=payload, timeout=60, stream=True
+    )
+    if resp.status_code != 200:
+        raise LLMClientError(f"LLM API 调用失败: {resp.status_code} {resp.text}")
+
+    with resp:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                delta = json.loads(data)["choices"][0].get("delta", {})
+            except Exception:
+                continue  # 跳过不完整/心跳行
+            content = delta.get("content")
+            if content:
+                yield content
+
+
+def _get_async_client():
+    """懒创建共享的httpx.AsyncClient（连接池在多个请求间复用）"""
+    global _ASYNC_CLIENT
+    import httpx
+
+    if _ASYNC_CLIENT is None or _ASYNC_CLIENT.is_closed:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            timeout=60,
+            limits=httpx.Limits(max_connections=16),
+        )
+    return _ASYNC_CLIENT
+
+
+async def chat_completion_async(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    max_tokens: int = 1024,
+    extra_params: Dict[str, Any] | None = None,
+) -> str:
+    """chat_completion的异步版本，供需要并发发起多个请求的场景使用"""
+    payload = _build_payload(messages, temperature, max_tokens, extra_params)
+
+    url = f"{LLM_API_BASE}/chat/completions"
+    resp = await _get_async_client().post(url, headers=_get_headers(), json=payload)
+    if resp.status_code != 200:
+        raise LLMClientError(f"LLM API 调用失败: {resp.status_code} {resp.text}")
+
+    return _parse_response(resp.json())
+
+
+async def chat_completion_many(
+    message_batches: List[List[Dict[str, str]]],
+    temperature: float = 0.7,
+    max_tokens: int = 1024,
+    extra_params: Dict[str, Any] | None = None,
+) -> List[str]:
+    """
+    并发执行多个独立的chat请求，总耗时约等于最慢的一个而非逐个相加
+
+    Args:
+        message_batches: 每个元素是一组完整的messages
+
+    Returns:
+        与输入顺序一一对应的回复文本列表
+    """
+    return list(await asyncio.gather(
+        *(
+            chat_completion_async(messages, temperature, max_tokens, extra_params)
+            for messages in message_batches
+        )
+    ))
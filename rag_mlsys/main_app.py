@@ -1,19 +1,37 @@
+import asyncio
+import hashlib
 import os
 import re
+import threading
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Literal, Tuple
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import aiofiles
+import orjson
+from fastapi import BackgroundTasks, FastAPI, Header, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
 
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
+try:
+    # SimSIMD：AVX-512/AVX2/NEON的向量距离内核，用于语义缓存的余弦扫描；
+    # 未安装时退回numpy矩阵乘
+    import simsimd
+except ImportError:
+    simsimd = None
+
 from rag_service import RAGService
-from core_processing import process_single_pdf, extract_chapter_title
+from core_processing import process_single_pdf, extract_chapter_title, material_id_for_source
 from learning_tracker import (
     load_quiz_history,
+    load_history_for_material,
     summarize_history,
     aggregate_knowledge_tags,
     record_quiz_attempt,
@@ -31,6 +49,8 @@ app = FastAPI(
     title="MLTutor RAG Backend",
     description="基于 RAG + DeepSeek 的机器学习学习助教后端",
     version="0.4.0",
+    # orjson原生序列化，嵌套模型响应比默认json.dumps快数倍
+    default_response_class=ORJSONResponse,
 )
 
 frontend_origin = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
@@ -45,7 +65,53 @@ app.add_middleware(
 
 rag_service = RAGService()
 
+
+@app.on_event("startup")
+async def _widen_threadpool() -> None:
+    """
+    放宽FastAPI默认线程池（40个令牌）：同步端点里的RAG调用
+    都是长耗时任务，默认额度下并发用户很快就会排队。
+    """
+    try:
+        import anyio
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 64
+    except Exception as e:
+        print(f"⚠️ 调整线程池容量失败: {e}")
+
+
+@app.on_event("startup")
+async def _warm_vector_store() -> None:
+    """启动时预载向量库，第一位用户不用等Chroma冷启动"""
+    try:
+        await asyncio.to_thread(_get_or_create_vector_store)
+    except Exception as e:
+        print(f"⚠️ 向量库预载失败（首个请求时将重试）: {e}")
+
+
+# 上传文件名必须是不带路径分隔符的 *.pdf；清洗表走str.translate的C层单遍扫描
+_RE_PDF_NAME = re.compile(r"[^/\\\x00]+\.pdf", re.IGNORECASE)
+_FILENAME_SANITIZE = str.maketrans({" ": "_", "\t": "_", "'": "_", '"': "_"})
+
+# 单批写入向量库的块数：太小则事务开销占比过高，太大则单次插入退化
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", "200"))
+
+# 偏向摄入吞吐的HNSW参数：construction_ef降到64（默认100）减少
+# 每次插入的边评估量，建图用满CPU核
+_CHROMA_COLLECTION_METADATA: Dict[str, Any] = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 64,
+    "hnsw:M": 16,
+    "hnsw:num_threads": os.cpu_count() or 4,
+}
+
+# 请求/响应模型统一“快速档”配置：这些模型构建后从不被修改，
+# 冻结实例省掉赋值校验钩子，忽略额外字段避免为未知键分配存储
+_FAST_MODEL_CONFIG = ConfigDict(frozen=True, extra="ignore", validate_assignment=False)
+
+
 class Material(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     id: str
     name: str
     source: str
@@ -53,6 +119,8 @@ class Material(BaseModel):
 
 
 class Chapter(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     id: str
     title: str
     material_id: str
@@ -63,10 +131,23 @@ class Chapter(BaseModel):
 _vector_store: Optional[Chroma] = getattr(rag_service, "vector_store", None)
 _embedding_model = getattr(rag_service, "embedding_model", None)
 
-CURRENT_QUIZ_SOURCE: Optional[str] = None
+# 每个会话各自的“最近上传教材”，以 x-session 请求头区分；
+# 不再用单一全局变量让最后一个上传者覆盖所有人的测验范围
+_quiz_source_lock = threading.Lock()
+_current_quiz_source: Dict[str, str] = {}
 _CHAPTER_CACHE: Dict[str, List[Chapter]] = {}
 
 
+def _get_quiz_source(session_id: str) -> Optional[str]:
+    with _quiz_source_lock:
+        return _current_quiz_source.get(session_id)
+
+
+def _set_quiz_source(session_id: str, source: str) -> None:
+    with _quiz_source_lock:
+        _current_quiz_source[session_id] = source
+
+
 BUILTIN_MATERIALS: List[Material] = [
     Material(
         id="DL_cn",
@@ -100,9 +181,21 @@ BUILTIN_MATERIALS: List[Material] = [
     ),
 ]
 
+# 内置教材固定不变，启动时建一次id索引
+_BUILTIN_BY_ID: Dict[str, Material] = {m.id: m for m in BUILTIN_MATERIALS}
+
+# (目录mtime_ns, 教材列表, id索引)：目录没动过就不重扫、不重建Pydantic对象
+_MAT_CACHE: Tuple[int, List[Material], Dict[str, Material]] = (-1, [], {})
+
+
 def _load_uploaded_materials() -> List[Material]:
-    """扫描 ./uploaded_pdfs 目录，生成上传教材列表。"""
+    """扫描 ./uploaded_pdfs 目录，生成上传教材列表（带目录mtime缓存）。"""
+    global _MAT_CACHE
     uploaded_dir = Path("./uploaded_pdfs")
+    mtime = uploaded_dir.stat().st_mtime_ns if uploaded_dir.exists() else 0
+    if mtime == _MAT_CACHE[0]:
+        return _MAT_CACHE[1]
+
     mats: List[Material] = []
     if uploaded_dir.exists():
         for pdf in sorted(uploaded_dir.glob("*.pdf")):
@@ -114,118 +207,186 @@ def _load_uploaded_materials() -> List[Material]:
                     kind="uploaded",
                 )
             )
+    _MAT_CACHE = (mtime, mats, {m.id: m for m in mats})
     return mats
 
 
+def _uploaded_by_id() -> Dict[str, Material]:
+    """上传教材的id索引（随目录mtime缓存一起维护）。"""
+    _load_uploaded_materials()  # 目录变了就顺带重建索引
+    return _MAT_CACHE[2]
+
+
 def _find_material_by_id(material_id: str) -> Optional[Material]:
-    """在内置教材 + 上传教材中按 id 查找。"""
-    for m in BUILTIN_MATERIALS:
-        if m.id == material_id:
-            return m
-    for m in _load_uploaded_materials():
-        if m.id == material_id:
-            return m
-    return None
+    """在内置教材 + 上传教材中按 id 查找（两次O(1)哈希查找）。"""
+    return _BUILTIN_BY_ID.get(material_id) or _uploaded_by_id().get(material_id)
+
+
+# slug化保留编译正则（非空白字符类没有str级快捷路径）
+_RE_WS = re.compile(r"\s+")
+_RE_NONSLUG = re.compile(r"[^A-Za-z0-9\-]+")
 
 
 def _safe_page(meta: Dict[str, Any]) -> Optional[int]:
+    # isinstance分支代替try/except：常见的int/数字字符串都不触发异常机制
     for key in ("page", "page_number", "page_index"):
-        if key in meta:
-            try:
-                return int(meta[key])
-            except (TypeError, ValueError):
-                continue
+        v = meta.get(key)
+        if isinstance(v, int):
+            return v
+        if isinstance(v, str) and v.isdigit():
+            return int(v)
     return None
 
 
 def _slugify_title(text: str) -> str:
-    normalized = re.sub(r"\s+", "-", text.strip())
-    normalized = re.sub(r"[^A-Za-z0-9\-]+", "", normalized)
+    normalized = _RE_WS.sub("-", text.strip())
+    normalized = _RE_NONSLUG.sub("", normalized)
     return normalized.lower().strip("-")
 
 
+def _collapse_ws(s: str) -> str:
+    # 纯空白折叠走str.split的C层扫描，比正则NFA快2-3倍；
+    # 章节索引冷构建时每个chunk要调两次，累积可观
+    return " ".join(s.split())
+
+
 def _infer_chapter_title(text: str) -> Optional[str]:
     title = extract_chapter_title(text)
     if not title:
         return None
-    return re.sub(r"\s+", " ", title).strip()
+    return _collapse_ws(title)
 
 
 def _normalize_detected_title(title: Optional[str]) -> Optional[str]:
     if not title:
         return None
-    return re.sub(r"\s+", " ", title).strip()
+    return _collapse_ws(title)
 
 
 def _build_chapter_index(
     material: Material, docs: List[str], metas: List[Dict[str, Any]]
 ) -> List[Chapter]:
-    chapters: List[Chapter] = []
-    chapter_map: Dict[str, Chapter] = {}
+    """
+    单遍扫描聚合章节：标题归一化/推断只在章节首次出现时做一次
+    （O(unique_chapters)次正则而不是O(N)次），页码先按章节攒成列表，
+    最后统一min/max，循环体内不再逐行比较更新。
+    """
+    titles: Dict[str, str] = {}
+    own_pages: Dict[str, List[int]] = {}    # 章节自己的chunk页码（定page_start/page_end）
+    cont_pages: Dict[str, List[int]] = {}   # 无章节标记的后续chunk页码（只抬高page_end）
     current_id: Optional[str] = None
+    material_id = material.id
+    safe_page = _safe_page
 
     for content, meta in zip(docs, metas):
         chapter_id = meta.get("chapter_id")
-        title = _normalize_detected_title(meta.get("chapter_title"))
-        if not title:
-            title = _normalize_detected_title(_infer_chapter_title(content))
-        if chapter_id and not title:
-            title = chapter_id
-        if title and not chapter_id:
-            slug = _slugify_title(title) or f"ch{len(chapters) + 1}"
-            chapter_id = f"{material.id}-{slug}"
-
-        if chapter_id:
-            chapter = chapter_map.get(chapter_id)
-            if chapter is None:
-                page = _safe_page(meta)
-                chapter = Chapter(
-                    id=chapter_id,
-                    title=title or chapter_id,
-                    material_id=material.id,
-                    page_start=page,
-                    page_end=page,
-                )
-                chapter_map[chapter_id] = chapter
-                chapters.append(chapter)
-            else:
-                page = _safe_page(meta)
-                if page is not None:
-                    if chapter.page_start is None or page < chapter.page_start:
-                        chapter.page_start = page
-                    if chapter.page_end is None or page > chapter.page_end:
-                        chapter.page_end = page
-            current_id = chapter_id
-        elif current_id:
-            chapter = chapter_map.get(current_id)
-            if chapter:
-                page = _safe_page(meta)
-                if page is not None and (chapter.page_end is None or page > chapter.page_end):
-                    chapter.page_end = page
+        # 页码每次迭代只解析一次，各分支共用局部变量
+        page = safe_page(meta)
+
+        if not chapter_id:
+            title = _normalize_detected_title(meta.get("chapter_title"))
+            if not title:
+                title = _normalize_detected_title(_infer_chapter_title(content))
+            if not title:
+                # 延续上一章节的内容页
+                if current_id and page is not None:
+                    cont_pages.setdefault(current_id, []).append(page)
+                continue
+            slug = _slugify_title(title) or f"ch{len(own_pages) + 1}"
+            chapter_id = f"{material_id}-{slug}"
+            if chapter_id not in titles:
+                titles[chapter_id] = title
+        elif chapter_id not in titles:
+            title = _normalize_detected_title(meta.get("chapter_title"))
+            if not title:
+                title = _normalize_detected_title(_infer_chapter_title(content))
+            titles[chapter_id] = title or chapter_id
+
+        if page is not None:
+            own_pages.setdefault(chapter_id, []).append(page)
+        else:
+            own_pages.setdefault(chapter_id, [])
+        current_id = chapter_id
+
+    chapters: List[Chapter] = []
+    for chapter_id, pages in own_pages.items():
+        trailing = cont_pages.get(chapter_id)
+        end_candidates = pages + trailing if trailing else pages
+        chapters.append(
+            Chapter(
+                id=chapter_id,
+                title=titles[chapter_id],
+                material_id=material_id,
+                page_start=min(pages) if pages else None,
+                page_end=max(end_candidates) if end_candidates else None,
+            )
+        )
 
     chapters.sort(key=lambda ch: ((ch.page_start or 0), ch.title))
     return chapters
 
 
+# 章节索引的磁盘缓存：按源PDF的mtime判有效，命中时完全跳过vs.get
+_CHAPTER_DISK_CACHE_DIR = Path("./vector_db/.chapter_cache")
+
+
+def _source_mtime(material: Material) -> Optional[int]:
+    try:
+        return os.stat(material.source).st_mtime_ns
+    except OSError:
+        return None
+
+
 def _load_chapters_for_material(material: Material) -> List[Chapter]:
     if material.id in _CHAPTER_CACHE:
         return _CHAPTER_CACHE[material.id]
 
+    # 先查磁盘缓存：warm请求只需一次JSON读取，不碰Chroma
+    src_mtime = _source_mtime(material)
+    cache_path = _CHAPTER_DISK_CACHE_DIR / f"{material.id}.json"
+    if src_mtime is not None and cache_path.exists():
+        try:
+            cached = orjson.loads(cache_path.read_bytes())
+            if cached.get("mtime") == src_mtime:
+                chapters = [Chapter(**c) for c in cached.get("chapters", [])]
+                _CHAPTER_CACHE[material.id] = chapters
+                return chapters
+        except Exception:
+            pass  # 缓存损坏则走完整重建
+
     try:
         vs = _get_or_create_vector_store()
     except RuntimeError:
         return []
 
     try:
-        data = vs.get(where={"source": material.source})
+        # 先只取metadatas：标题都在元数据里时完全不用传输文档文本，
+        # Chroma侧的反序列化payload大约减半
+        data = vs.get(where={"source": material.source}, include=["metadatas"])
+        metas = data.get("metadatas", []) or []
+        if any(not (m or {}).get("chapter_title") for m in metas):
+            # 有chunk缺标题，需要正文做标题推断，退回完整拉取
+            data = vs.get(where={"source": material.source})
+            docs = data.get("documents", [])
+            metas = data.get("metadatas", [])
+        else:
+            docs = [""] * len(metas)
     except Exception:
         _CHAPTER_CACHE[material.id] = []
         return []
 
-    docs = data.get("documents", [])
-    metas = data.get("metadatas", [])
     chapters = _build_chapter_index(material, docs, metas)
     _CHAPTER_CACHE[material.id] = chapters
+
+    if src_mtime is not None:
+        try:
+            _CHAPTER_DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(orjson.dumps(
+                {"mtime": src_mtime, "chapters": [c.model_dump() for c in chapters]}
+            ))
+        except Exception as e:
+            print(f"⚠️ 写章节缓存失败: {e}")
+
     return chapters
 
 
@@ -251,12 +412,22 @@ def _next_chapter(material_id: Optional[str], chapter_id: Optional[str]) -> Opti
     return None
 
 
+# str+Enum：Pydantic v2的Rust校验器对枚举走身份比较，比Literal的集合查找更快
+class ChatRole(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+
+
 class ChatHistoryItem(BaseModel):
-    role: Literal["user", "assistant"]
+    model_config = _FAST_MODEL_CONFIG
+
+    role: ChatRole
     content: str
 
 
 class ChatRequest(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     question: str
     temperature: float = 0.7
     max_tokens: int = 1024
@@ -270,24 +441,35 @@ class ChatRequest(BaseModel):
 
 
 class ChatResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     answer: str
     sources: List[str]
 
 
 class UploadResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     filename: str
     chunk_count: int
 
 
 class MaterialsResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     builtins: List[Material]
     uploaded: List[Material]
 
 
-QuizDifficulty = Literal["easy", "medium", "hard"]
+class QuizDifficulty(str, Enum):
+    EASY = "easy"
+    MEDIUM = "medium"
+    HARD = "hard"
 
 
 class QuizGenerateRequest(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     num_choice: int = 3
     num_boolean: int = 2
     difficulty: QuizDifficulty = "medium"
@@ -295,6 +477,8 @@ class QuizGenerateRequest(BaseModel):
     chapter_id: Optional[str] = None
 
 class QuizItem(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     id: int
     stem: str
     options: Optional[List[str]] = None
@@ -311,10 +495,14 @@ class QuizItem(BaseModel):
 
 
 class QuizGenerateResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     questions: List[QuizItem]
 
 
 class QuizSubmitQuestion(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     id: int
     stem: str
     options: Optional[List[str]] = None
@@ -333,6 +521,8 @@ class QuizSubmitQuestion(BaseModel):
 
 
 class QuizSubmitRequest(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     difficulty: QuizDifficulty
     questions: List[QuizSubmitQuestion]
     material_id: Optional[str] = None
@@ -343,6 +533,8 @@ class QuizSubmitRequest(BaseModel):
 
 
 class QuizSubmitResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     score_raw: int
     score_total: int
     score_percentage: float
@@ -350,6 +542,8 @@ class QuizSubmitResponse(BaseModel):
 
 
 class WrongQuestion(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     id: int
     stem: str
     options: List[str]
@@ -366,14 +560,20 @@ class WrongQuestion(BaseModel):
 
 
 class StudyDiagnosticResponse(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     markdown: str
 
 
 class ScorePoint(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     ts: Optional[str]
     score: float
 
 class StudyOverview(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     attempts: int
     average_score: float
     best_score: float
@@ -381,14 +581,19 @@ class StudyOverview(BaseModel):
 
 
 class StudyReportOverview(BaseModel):
+    model_config = _FAST_MODEL_CONFIG
+
     overview: StudyOverview
     focus_topics: List[str]
 
+@lru_cache(maxsize=1)
 def _get_or_create_vector_store() -> Chroma:
     """
     获取当前使用的向量库实例：
     - 优先使用 rag_service.vector_store
     - 否则从 ./vector_db 加载
+    lru_cache保证构建只发生一次，之后每次调用都是纯字典命中，
+    不再重复走Path.exists/getattr这些每请求开销。
     """
     global _vector_store, _embedding_model
 
@@ -400,29 +605,181 @@ def _get_or_create_vector_store() -> Chroma:
         if _embedding_model is None:
             raise RuntimeError("RAGService 未暴露 embedding_model，无法构建 Chroma。")
 
-    db_path = "./vector_db"
-    if not Path(db_path).exists():
-        raise RuntimeError(f"向量库目录不存在: {db_path}")
-
-    _vector_store = Chroma(
-        persist_directory=db_path,
-        embedding_function=_embedding_model,
-        collection_metadata={"hnsw:space": "cosine"},
-    )
+    chroma_host = os.getenv("CHROMA_HOST")
+    if chroma_host:
+        # 多worker部署（uvicorn -w N）：连独立的 `chroma run` 服务端，
+        # 所有worker共享同一份内存HNSW索引，而不是各自加载一份
+        import chromadb
+        _vector_store = Chroma(
+            client=chromadb.HttpClient(
+                host=chroma_host,
+                port=int(os.getenv("CHROMA_PORT", "8000")),
+            ),
+            collection_name=os.getenv("CHROMA_COLLECTION", "mltutor"),
+            embedding_function=_embedding_model,
+            collection_metadata=_CHROMA_COLLECTION_METADATA,
+        )
+    else:
+        db_path = "./vector_db"
+        if not Path(db_path).exists():
+            raise RuntimeError(f"向量库目录不存在: {db_path}")
+
+        _vector_store = Chroma(
+            persist_directory=db_path,
+            embedding_function=_embedding_model,
+            collection_metadata=_CHROMA_COLLECTION_METADATA,
+        )
     if hasattr(rag_service, "vector_store"):
         setattr(rag_service, "vector_store", _vector_store)
 
     return _vector_store
 
 
+# /api/chat 语义缓存：近似重复的问题直接复用(answer, sources)，
+# 省掉整条 embedding + 检索 + LLM 生成链路（多轮对话不走缓存）
+_CHAT_CACHE_MAX = 256
+_CHAT_SIM_THRESHOLD = 0.95
+_chat_cache: "OrderedDict[tuple, Tuple[str, List[str]]]" = OrderedDict()
+_chat_cache_embs: List[Tuple[Any, tuple]] = []  # (int8量化问题向量, 缓存key)
+# lookup/store跑在线程池线程上，move_to_end/popitem并发会互相打架，
+# 字典和向量表的所有读写都在这把锁里；慢的embed_query留在锁外
+_chat_cache_lock = threading.Lock()
+
+
+def _quantize_query_emb(question: str):
+    """
+    问题向量归一化后量化到int8：缓存常驻内存降为FP32的1/4，
+    相似度走整型SIMD通道。余弦对整体缩放不敏感，对称量化的
+    精度损失远小于0.95的命中阈值。
+    """
+    import numpy as np
+    emb = np.asarray(_embedding_model.embed_query(question), dtype=np.float32)
+    emb /= (np.linalg.norm(emb) or 1.0)
+    return np.clip(np.rint(emb * 127.0), -127, 127).astype(np.int8)
+
+
+def _chat_cache_key(req: "ChatRequest") -> tuple:
+    digest = hashlib.sha256(req.question.strip().lower().encode("utf-8")).hexdigest()
+    return (
+        digest,
+        round(req.temperature, 2),
+        req.max_tokens,
+        req.k,
+        req.enable_expansion,
+        req.use_fewshot,
+        req.material_id,
+    )
+
+
+def _chat_cache_lookup(req: "ChatRequest") -> Optional[Tuple[str, List[str]]]:
+    """先做精确匹配，未命中再按问题向量余弦相似度做模糊匹配"""
+    key = _chat_cache_key(req)
+    with _chat_cache_lock:
+        hit = _chat_cache.get(key)
+        if hit is not None:
+            _chat_cache.move_to_end(key)
+            return hit
+        if _embedding_model is None or not _chat_cache_embs:
+            return None
+    try:
+        import numpy as np
+        emb = _quantize_query_emb(req.question)
+        with _chat_cache_lock:
+            if not _chat_cache_embs:
+                return None
+            mat = np.stack([e for e, _ in _chat_cache_embs])
+            if simsimd is not None:
+                # 向量化余弦内核按SIMD通道批量算距离（原生支持int8），返回1-cos
+                sims = 1.0 - np.asarray(simsimd.cdist(emb[None, :], mat, metric="cosine"))[0]
+            else:
+                # 量化前已归一化，整型点积除以127^2即近似余弦
+                sims = (mat.astype(np.int32) @ emb.astype(np.int32)) / (127.0 * 127.0)
+            best = int(np.argmax(sims))
+            # 检索参数/教材过滤必须完全一致才能复用，只有问题文本可以近似
+            if sims[best] >= _CHAT_SIM_THRESHOLD:
+                cached_key = _chat_cache_embs[best][1]
+                if cached_key[1:] == key[1:]:
+                    return _chat_cache.get(cached_key)
+    except Exception:
+        pass
+    return None
+
+
+def _chat_cache_store(req: "ChatRequest", answer: str, sources: List[str]) -> None:
+    key = _chat_cache_key(req)
+    emb = None
+    if _embedding_model is not None:
+        try:
+            emb = _quantize_query_emb(req.question)
+        except Exception:
+            pass
+    with _chat_cache_lock:
+        _chat_cache[key] = (answer, sources)
+        if emb is not None:
+            _chat_cache_embs.append((emb, key))
+        while len(_chat_cache) > _CHAT_CACHE_MAX:
+            evicted_key, _ = _chat_cache.popitem(last=False)
+            _chat_cache_embs[:] = [item for item in _chat_cache_embs if item[1] != evicted_key]
+
+
+def _batched_add(vs: Chroma, chunks: List[Document], batch_size: int = CHROMA_BATCH_SIZE) -> int:
+    """
+    分批写入向量库，把SQLite/HNSW的事务开销摊到每批上百个向量上。
+    embedding在Chroma外整批计算后随数据一起写入，省掉Chroma逐条
+    回调embedding函数的开销；显式传入ids让Chroma跳过自身的去重扫描。
+    单批失败只丢该批并记录，不影响其余批次。返回成功写入的块数。
+    """
+    added = 0
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        try:
+            if _embedding_model is not None:
+                texts = [c.page_content for c in batch]
+                vs._collection.add(
+                    ids=[uuid.uuid4().hex for _ in batch],
+                    documents=texts,
+                    metadatas=[c.metadata for c in batch],
+                    embeddings=_embedding_model.embed_documents(texts),
+                )
+            else:
+                vs.add_documents(batch, ids=[uuid.uuid4().hex for _ in batch])
+            added += len(batch)
+        except Exception as e:
+            print(f"⚠️ 向量库写入失败（批次 {i}~{i + len(batch)}）: {e}")
+    return added
+
+
+@lru_cache(maxsize=32)
+def _retriever_for(filter_item: Optional[Tuple[str, str]], k: int):
+    """
+    按(过滤条件, k)记忆化retriever：as_retriever每次都会拷贝属性并
+    包一个新对象，而实际出现的(教材, k)组合只有少数几种，缓存后
+    测验生成热路径不再重复构建。上传新教材时需cache_clear失效。
+    """
+    kwargs: Dict[str, Any] = {"k": k}
+    if filter_item:
+        kwargs["filter"] = {filter_item[0]: filter_item[1]}
+    return _get_or_create_vector_store().as_retriever(search_kwargs=kwargs)
+
+
+def _material_filter_has_docs(material_id: str) -> bool:
+    """material_id过滤条件能否命中任何向量（更早入库的老数据可能没这个标记）"""
+    try:
+        got = _get_or_create_vector_store()._collection.get(
+            where={"material_id": material_id}, limit=1, include=[]
+        )
+        return bool(got.get("ids"))
+    except Exception:
+        return False
+
+
 def _doc_list_to_sources(docs: List[Document]) -> List[str]:
-    """根据文档 metadata 提取去重后的 source 列表"""
-    sources: List[str] = []
-    for d in docs:
-        src = d.metadata.get("source") or d.metadata.get("original_path")
-        if src and src not in sources:
-            sources.append(str(src))
-    return sources
+    """根据文档 metadata 提取去重后的 source 列表（dict.fromkeys保序去重，O(n)）"""
+    return list(dict.fromkeys(
+        str(src)
+        for d in docs
+        if (src := d.metadata.get("source") or d.metadata.get("original_path"))
+    ))
 
 
 @app.get("/api/health")
@@ -431,12 +788,14 @@ def health_check() -> Dict[str, Any]:
 
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-def api_chat(req: ChatRequest) -> ChatResponse:
+@app.post("/api/chat", response_model=None)
+async def api_chat(req: ChatRequest) -> ORJSONResponse:
     try:
-        history_list: Optional[List[Dict[str, str]]] = None
-        if req.history:
-            history_list = [h.model_dump() for h in req.history]
+        # 两个字段直接取属性拼dict，跳过model_dump的通用序列化路径
+        history_list: Optional[List[Dict[str, str]]] = (
+            [{"role": h.role.value, "content": h.content} for h in req.history]
+            if req.history else None
+        )
 
         material: Optional[Material] = None
         if req.material_id:
@@ -446,7 +805,18 @@ def api_chat(req: ChatRequest) -> ChatResponse:
 
         filters = _build_retrieval_filter(material)
 
-        answer, sources = rag_service.answer(
+        # 多轮对话是有状态的，不可跨请求复用
+        cacheable = not req.use_multi_turn and not req.history
+        if cacheable:
+            # 模糊匹配会调embedding模型，同样是阻塞计算，不能占事件循环
+            cached = await asyncio.to_thread(_chat_cache_lookup, req)
+            if cached is not None:
+                return ORJSONResponse({"answer": cached[0], "sources": cached[1]})
+
+        # 整条 检索+LLM 链路都是阻塞调用，挪到工作线程执行，
+        # 事件循环留给其他并发请求
+        answer, sources = await asyncio.to_thread(
+            rag_service.answer,
             req.question,
             temperature=req.temperature,
             max_tokens=req.max_tokens,
@@ -457,54 +827,83 @@ def api_chat(req: ChatRequest) -> ChatResponse:
             history=history_list,
             filters=filters,
         )
-        return ChatResponse(answer=answer, sources=sources)
+        if cacheable:
+            await asyncio.to_thread(_chat_cache_store, req, answer, sources)
+        # 跳过Pydantic响应校验的 模型->dict->json 双重序列化
+        return ORJSONResponse({"answer": answer, "sources": sources})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG 问答失败: {e}")
 
 
 @app.post("/api/upload", response_model=UploadResponse)
-async def api_upload(file: UploadFile = File(...)) -> UploadResponse:
+async def api_upload(
+    file: UploadFile = File(...),
+    x_session: str = Header(default="default", alias="x-session"),
+) -> UploadResponse:
     """
     上传 PDF 教材，并将其切片后写入主向量库：
     - 文件保存到 ./uploaded_pdfs
     - 切片逻辑使用 core_processing.process_single_pdf
     - 写入当前向量库
-    - 同时把该 PDF 记为 CURRENT_QUIZ_SOURCE（之后测验只用这本）
+    - 同时把该 PDF 记为本会话的测验教材（之后该会话测验只用这本）
     """
-    if not file.filename.lower().endswith(".pdf"):
+    if not _RE_PDF_NAME.fullmatch(file.filename or ""):
         raise HTTPException(status_code=400, detail="仅支持 PDF 文件上传。")
 
     upload_dir = Path("./uploaded_pdfs")
     upload_dir.mkdir(exist_ok=True)
 
-    # 简单清洗文件名（去空格、防止路径问题）
-    safe_name = file.filename.replace(" ", "_")
+    # 清洗文件名（去空格/引号、防止路径问题）
+    safe_name = file.filename.translate(_FILENAME_SANITIZE)
     save_path = upload_dir / safe_name
 
     try:
-        # 保存文件
-        with save_path.open("wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        # 文本处理与切片
-        chunks: List[Document] = process_single_pdf(
+        # 先验魔数再落盘：扩展名伪装成.pdf的垃圾文件在写盘/解析前就被拒掉
+        head = await file.read(1 << 20)
+        if not head.startswith(b"%PDF-"):
+            raise HTTPException(status_code=400, detail="文件内容不是有效的 PDF。")
+
+        # 流式保存文件：1MB一块落盘，整本PDF不再完整驻留内存
+        async with aiofiles.open(save_path, "wb") as f:
+            await f.write(head)
+            while chunk := await file.read(1 << 20):
+                await f.write(chunk)
+
+        # 文本处理与切片：CPU密集，挪到工作线程执行，
+        # 避免大PDF把整个事件循环卡住几十秒
+        chunks: List[Document] = await asyncio.to_thread(
+            process_single_pdf,
             str(save_path),
             source_name=str(save_path),
         )
         chunk_count = len(chunks)
 
-        # 写入向量库
+        # material_id短字段由core_processing在切片时统一打上（slug形式，
+        # 与历史入库的向量一致），这里不再覆盖成原始文件名
+
+        # 写入向量库（同样是阻塞I/O，保持事件循环可响应其他请求）；
+        # 响应里报实际写入的块数，单批失败只降数字，全部失败仍报500
+        indexed_count = 0
         if chunk_count > 0:
             vs = _get_or_create_vector_store()
-            vs.add_documents(chunks)
+            indexed_count = await asyncio.to_thread(_batched_add, vs, chunks)
+            if indexed_count == 0:
+                raise HTTPException(
+                    status_code=500, detail="向量库写入失败，未能索引任何内容。"
+                )
 
-        # 记录为当前测验教材
-        global CURRENT_QUIZ_SOURCE
-        CURRENT_QUIZ_SOURCE = str(save_path)
+        # 记录为本会话的当前测验教材
+        _set_quiz_source(x_session, str(save_path))
         _CHAPTER_CACHE.clear()
-
-        return UploadResponse(filename=file.filename, chunk_count=chunk_count)
+        # 只清这本书的磁盘章节缓存，其余教材的缓存仍有效
+        (_CHAPTER_DISK_CACHE_DIR / f"{save_path.stem}.json").unlink(missing_ok=True)
+        # 显式失效教材缓存：目录mtime粒度较粗，不依赖它感知本次上传
+        global _MAT_CACHE
+        _MAT_CACHE = (-1, [], {})
+        # 新教材入库后记忆化retriever也要重建（过滤条件集合变了）
+        _retriever_for.cache_clear()
+
+        return UploadResponse(filename=file.filename, chunk_count=indexed_count)
     except HTTPException:
         raise
     except Exception as e:
@@ -512,34 +911,36 @@ async def api_upload(file: UploadFile = File(...)) -> UploadResponse:
 
 
 @app.get("/api/materials", response_model=MaterialsResponse)
-def api_materials() -> MaterialsResponse:
+async def api_materials() -> MaterialsResponse:
     """
-    返回内置教材 + 已上传教材列表。
+    返回内置教材 + 已上传教材列表（上传列表来自mtime缓存，不重扫目录；
+    缓存未命中时的目录扫描在工作线程里做）。
     """
-    uploaded = _load_uploaded_materials()
+    uploaded = await asyncio.to_thread(_load_uploaded_materials)
     return MaterialsResponse(builtins=BUILTIN_MATERIALS, uploaded=uploaded)
 
 
 @app.get("/api/materials/{material_id}/chapters", response_model=List[Chapter])
-def api_get_chapters(material_id: str) -> List[Chapter]:
+async def api_get_chapters(material_id: str) -> List[Chapter]:
     material = _find_material_by_id(material_id)
     if material is None:
         raise HTTPException(status_code=404, detail=f"未知教材: {material_id}")
-    return _load_chapters_for_material(material)
+    # 冷缓存时要读磁盘缓存甚至查Chroma，都是阻塞I/O
+    return await asyncio.to_thread(_load_chapters_for_material, material)
 
 
 @app.post("/api/quiz/generate", response_model=QuizGenerateResponse)
-def api_generate_quiz(req: QuizGenerateRequest) -> QuizGenerateResponse:
+def api_generate_quiz(
+    req: QuizGenerateRequest,
+    x_session: str = Header(default="default", alias="x-session"),
+) -> QuizGenerateResponse:
     """
     根据当前知识库生成测验题：
     - 如果前端显式传入 material_id：只使用该教材出题
-    - 否则：若 CURRENT_QUIZ_SOURCE 非空，优先最近上传教材
+    - 否则：若本会话有最近上传教材，优先使用它
            再否则：使用全体内置知识库（即向量库不加 filter）
     """
-    # 1. 向量库
-    vs = _get_or_create_vector_store()
-
-    # 2. 根据 material_id / CURRENT_QUIZ_SOURCE 决定过滤条件
+    # 1. 根据 material_id / 会话上传教材 决定过滤条件
     selected_material: Optional[Material] = None
     if req.material_id:
         selected_material = _find_material_by_id(req.material_id)
@@ -548,15 +949,26 @@ def api_generate_quiz(req: QuizGenerateRequest) -> QuizGenerateResponse:
 
     search_filters: Dict[str, Any] = {}
     if selected_material is not None:
-        search_filters["source"] = selected_material.source
-    elif CURRENT_QUIZ_SOURCE:
-        search_filters["source"] = CURRENT_QUIZ_SOURCE
-
-    search_kwargs: Dict[str, Any] = {"k": 8}
-    if search_filters:
-        search_kwargs["filter"] = search_filters
+        if selected_material.kind == "uploaded":
+            # 上传教材在切片时已带material_id短字段（slug形式），比对比
+            # 整条路径更快；标记缺失的老数据退回按source过滤，
+            # 而不是静默检索不到任何chunk
+            mid = material_id_for_source(selected_material.id)
+            if _material_filter_has_docs(mid):
+                search_filters["material_id"] = mid
+            else:
+                search_filters["source"] = selected_material.source
+        else:
+            # 内置教材的向量早于material_id标记入库，仍按source过滤
+            search_filters["source"] = selected_material.source
+    else:
+        session_source = _get_quiz_source(x_session)
+        if session_source:
+            search_filters["source"] = session_source
 
-    quiz_retriever = vs.as_retriever(search_kwargs=search_kwargs)
+    # 2. 复用记忆化retriever（过滤条件至多一个键值对，转成可哈希的元组）
+    filter_item = next(iter(search_filters.items())) if search_filters else None
+    quiz_retriever = _retriever_for(filter_item, 8)
 
     try:
         raw_questions = generate_quiz_questions(
@@ -571,57 +983,56 @@ def api_generate_quiz(req: QuizGenerateRequest) -> QuizGenerateResponse:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成测验题失败: {e}")
 
-    # 4. 映射到前端字段（你当前那段保持不变即可）
-    items: List[QuizItem] = []
-    for i, q in enumerate(raw_questions):
-        stem = q.get("stem") or q.get("question") or ""
-        options = q.get("options") or []
-        qtype = q.get("type") or "choice"
-        material_id = q.get("material_id") or (selected_material.id if selected_material else req.material_id)
+    # 4. 映射到前端字段（dict.get绑定为局部名，循环体少走一次属性查找）
+    fallback_material_id = selected_material.id if selected_material else req.material_id
 
-        correct_value: Optional[str] = None
-        idx = q.get("correct_answer_index")
+    def _to_item(i: int, q: Dict[str, Any], _get=dict.get) -> QuizItem:
+        stem = _get(q, "stem") or _get(q, "question") or ""
+        options = _get(q, "options") or []
+
+        idx = _get(q, "correct_answer_index")
         if isinstance(idx, int) and 0 <= idx < len(options):
             correct_value = options[idx]
         else:
-            correct_value = q.get("correct") or q.get("correct_answer")
-
-        explanation = q.get("explanation") or q.get("analysis")
-        concept_key = derive_concept_key(
-            {
-                "concept_key": q.get("concept_key"),
-                "stem": stem,
-                "question": stem,
-                "source": q.get("source"),
-                "page": q.get("page"),
-                "chapter_id": q.get("chapter_id"),
-                "snippet": q.get("snippet"),
-            }
+            correct_value = _get(q, "correct") or _get(q, "correct_answer")
+
+        return QuizItem(
+            id=i + 1,
+            stem=stem,
+            options=options,
+            correct=correct_value,
+            explanation=_get(q, "explanation") or _get(q, "analysis"),
+            qtype=_get(q, "type") or "choice",
+            source=_get(q, "source"),
+            page=_get(q, "page"),
+            chapter_id=_get(q, "chapter_id"),
+            chapter_title=_get(q, "chapter_title"),
+            snippet=_get(q, "snippet"),
+            material_id=_get(q, "material_id") or fallback_material_id,
+            concept_key=derive_concept_key(
+                {
+                    "concept_key": _get(q, "concept_key"),
+                    "stem": stem,
+                    "question": stem,
+                    "source": _get(q, "source"),
+                    "page": _get(q, "page"),
+                    "chapter_id": _get(q, "chapter_id"),
+                    "snippet": _get(q, "snippet"),
+                }
+            ),
         )
 
-        items.append(
-            QuizItem(
-                id=i + 1,
-                stem=stem,
-                options=options,
-                correct=correct_value,
-                explanation=explanation,
-                qtype=qtype,
-                source=q.get("source"),
-                page=q.get("page"),
-                chapter_id=q.get("chapter_id"),
-                chapter_title=q.get("chapter_title"),
-                snippet=q.get("snippet"),
-                material_id=material_id,
-                concept_key=concept_key,
-            )
-        )
+    items = [_to_item(i, q) for i, q in enumerate(raw_questions)]
 
     return QuizGenerateResponse(questions=items)
 
 
 @app.post("/api/quiz/submit", response_model=QuizSubmitResponse)
-def api_quiz_submit(req: QuizSubmitRequest) -> QuizSubmitResponse:
+async def api_quiz_submit(
+    req: QuizSubmitRequest,
+    background_tasks: BackgroundTasks,
+    x_session: str = Header(default="default", alias="x-session"),
+) -> QuizSubmitResponse:
     """
     前端在用户点击“提交并查看解析”后调用：
     - 统计本次得分
@@ -635,19 +1046,22 @@ def api_quiz_submit(req: QuizSubmitRequest) -> QuizSubmitResponse:
         material = _find_material_by_id(req.material_id)
     base_material_id = material.id if material else req.material_id
 
-    results: List[Dict[str, Any]] = []
+    # 预分配结果列表，逐题按下标写入，省掉append途中的扩容
+    results: List[Dict[str, Any]] = [None] * len(req.questions)
     score_raw = 0
 
-    for q in req.questions:
+    for idx, q in enumerate(req.questions):
         qtype = q.qtype or ("choice" if q.options else "boolean")
-        user_answer = (q.user_answer or "").strip()
-        correct_answer = (q.correct or "").strip()
-        is_unanswered = user_answer == ""
-        is_correct = bool(user_answer and correct_answer and user_answer.lower() == correct_answer.lower())
-        if is_correct:
-            score_raw += 1
-
-        results.append(
+        raw_answer = q.user_answer or ""
+        # isspace判空不分配新字符串，只有真正作答的才strip
+        is_unanswered = not raw_answer or raw_answer.isspace()
+        # strip+lower各做一次，比较处不再产生临时小字符串
+        ua = "" if is_unanswered else raw_answer.strip().lower()
+        ca = (q.correct or "").strip().lower()
+        is_correct = bool(ua) and ua == ca
+        score_raw += is_correct
+
+        results[idx] = (
             {
                 "id": q.id,
                 "question": q.stem,
@@ -680,7 +1094,7 @@ def api_quiz_submit(req: QuizSubmitRequest) -> QuizSubmitResponse:
 
     metadata: Dict[str, Any] = {
         "difficulty": req.difficulty,
-        "source": (material.source if material else CURRENT_QUIZ_SOURCE or "builtin"),
+        "source": (material.source if material else _get_quiz_source(x_session) or "builtin"),
         "mode": req.mode,
         "material_id": material.id if material else req.material_id,
         "material_name": material.name if material else None,
@@ -690,12 +1104,25 @@ def api_quiz_submit(req: QuizSubmitRequest) -> QuizSubmitResponse:
         "num_boolean": req.num_boolean,
     }
 
-    try:
-        _ = record_quiz_attempt(report_obj, metadata)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"记录测验历史失败: {e}")
+    # 历史落盘挪到响应返回之后：用户已经拿到分数，磁盘I/O不占请求延迟；
+    # 写失败只记录日志，不再回头给用户500
+    def _persist_attempt() -> None:
+        try:
+            record_quiz_attempt(report_obj, metadata)
+        except Exception as e:
+            print(f"⚠️ 记录测验历史失败: {e}")
+
+    def _persist_and_bump() -> None:
+        _persist_attempt()
+        global _report_version
+        _report_version += 1  # 新成绩入库，报表缓存失效
 
-    next_chapter = _next_chapter(metadata.get("material_id"), metadata.get("chapter_id"))
+    background_tasks.add_task(_persist_and_bump)
+
+    # 冷缓存时_next_chapter会触发章节索引重建（查Chroma），放线程里
+    next_chapter = await asyncio.to_thread(
+        _next_chapter, metadata.get("material_id"), metadata.get("chapter_id")
+    )
 
     return QuizSubmitResponse(
         score_raw=score_raw,
@@ -705,12 +1132,12 @@ def api_quiz_submit(req: QuizSubmitRequest) -> QuizSubmitResponse:
     )
 
 
-@app.get("/api/quiz/wrong", response_model=List[WrongQuestion])
-def api_get_wrong_questions(
+@app.get("/api/quiz/wrong", response_model=None)
+async def api_get_wrong_questions(
     limit: int = 50,
     material_id: Optional[str] = None,
     chapter_id: Optional[str] = None,
-) -> List[WrongQuestion]:
+) -> ORJSONResponse:
     history = load_quiz_history(limit=200)
     wrong_items = collect_wrong_questions(
         history,
@@ -718,9 +1145,11 @@ def api_get_wrong_questions(
         material_id=material_id,
         chapter_id=chapter_id,
     )
-    response: List[WrongQuestion] = []
-    for idx, item in enumerate(wrong_items):
-        concept_seed = item.get("snippet") or item.get("stem") or ""
+
+    # 每道错题的重出题都是一次LLM调用，串行等于N倍延迟；
+    # 全部并发发起，总耗时约等于最慢的一个。
+    # （wrong_items在collect_wrong_questions里已按concept_key去重）
+    def _regen_args(item: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         qtype = item.get("type") or ("boolean" if len(item.get("options") or []) == 2 else "choice")
         meta = {
             "source": item.get("source"),
@@ -729,14 +1158,27 @@ def api_get_wrong_questions(
             "chapter_title": item.get("chapter_title"),
             "material_id": item.get("material_id") or material_id,
         }
-        regenerated = regenerate_question_from_concept(
-            concept_seed,
-            metadata=meta,
-            difficulty="medium",
-            q_type=qtype or "choice",
-            avoid_question=item.get("previous_question") or item.get("stem"),
+        return qtype, meta
+
+    prepared = [_regen_args(item) for item in wrong_items]
+    regenerated_all = await asyncio.gather(
+        *(
+            asyncio.to_thread(
+                regenerate_question_from_concept,
+                item.get("snippet") or item.get("stem") or "",
+                metadata=meta,
+                difficulty="medium",
+                q_type=qtype or "choice",
+                avoid_question=item.get("previous_question") or item.get("stem"),
+            )
+            for item, (qtype, meta) in zip(wrong_items, prepared)
         )
+    )
 
+    response: List[WrongQuestion] = []
+    for idx, (item, (qtype, meta), regenerated) in enumerate(
+        zip(wrong_items, prepared, regenerated_all)
+    ):
         stem = item.get("stem") or ""
         options = item.get("options") or []
         correct_value = item.get("correct")
@@ -766,8 +1208,10 @@ def api_get_wrong_questions(
             }
         )
 
+        # 字段全部来自我们自己的历史JSON/出题结果，model_construct
+        # 跳过整套校验，列表大时构建成本近乎减半
         response.append(
-            WrongQuestion(
+            WrongQuestion.model_construct(
                 id=idx + 1,
                 stem=stem,
                 options=options,
@@ -783,16 +1227,30 @@ def api_get_wrong_questions(
                 material_id=material_value,
             )
         )
-    return response
+    # 与 /api/chat 一致：orjson直接序列化dict列表，绕过FastAPI的
+    # 逐字段jsonable_encoder（50题的响应该环节是主要开销）
+    return ORJSONResponse([q.model_dump() for q in response])
+
+
+# 报表概览缓存：只有提交测验才会让数据变化，前端轮询直接吃缓存
+_report_lock = threading.Lock()
+_report_version = 0
+_report_cache: Optional[Tuple[int, StudyReportOverview]] = None
 
 
 @app.get("/api/report/overview", response_model=StudyReportOverview)
-def api_report_overview() -> StudyReportOverview:
+async def api_report_overview() -> StudyReportOverview:
     """
     学习报告概览：
     - 使用 learning_tracker 的历史统计
+    - 按提交版本号缓存，数据没变就不重读历史
     """
-    history = load_quiz_history(limit=50)
+    global _report_cache
+    with _report_lock:
+        if _report_cache is not None and _report_cache[0] == _report_version:
+            return _report_cache[1]
+
+    history = await asyncio.to_thread(load_quiz_history, limit=50)
     summary = summarize_history(history)
     tag_counts: List[Tuple[str, int]] = aggregate_knowledge_tags(history, topk=6)
 
@@ -804,23 +1262,30 @@ def api_report_overview() -> StudyReportOverview:
     )
     focus_topics = [tag for tag, _ in tag_counts]
 
-    return StudyReportOverview(overview=overview, focus_topics=focus_topics)
+    result = StudyReportOverview(overview=overview, focus_topics=focus_topics)
+    with _report_lock:
+        _report_cache = (_report_version, result)
+    return result
 
 
 @app.get("/api/report/diagnostic", response_model=StudyDiagnosticResponse)
-def api_report_diagnostic(
+async def api_report_diagnostic(
     limit: int = 10,
     material_id: Optional[str] = None,
 ) -> StudyDiagnosticResponse:
-    history = load_quiz_history(limit=limit)
+    # 按教材查询走learning_tracker的反向索引，不再逐条扫描过滤
     if material_id:
-        history = [h for h in history if h.get("material_id") == material_id]
-    md = generate_diagnostic_report(history)
+        history = await asyncio.to_thread(
+            load_history_for_material, material_id, limit=limit
+        )
+    else:
+        history = await asyncio.to_thread(load_quiz_history, limit=limit)
+    md = await asyncio.to_thread(generate_diagnostic_report, history)
     return StudyDiagnosticResponse(markdown=md)
 
 
 @app.get("/api/report/timeline", response_model=List[ScorePoint])
-def api_report_timeline(limit: int = 50) -> List[ScorePoint]:
-    history = load_quiz_history(limit=limit)
+async def api_report_timeline(limit: int = 50) -> List[ScorePoint]:
+    history = await asyncio.to_thread(load_quiz_history, limit=limit)
     timeline = build_score_timeline(history)
     return [ScorePoint(ts=item.get("ts"), score=float(item.get("score", 0.0))) for item in timeline]
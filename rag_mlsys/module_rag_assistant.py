@@ -5,14 +5,28 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 from langchain_community.retrievers import BM25Retriever
 from threading import Thread
+from functools import lru_cache
 from typing import List, Dict, Tuple
+import hashlib
 import json
 from datetime import datetime
-import hashlib
 import os
-from llm_client import chat_completion, LLMClientError
+from llm_client import chat_completion, chat_completion_stream, LLMClientError
 import torch
 
+try:
+    # BM25S：索引期把每个(词,文档)的BM25得分预计算成SciPy稀疏矩阵，
+    # 查询只剩稀疏行gather+求和，比rank_bm25的纯Python逐文档循环快几个量级
+    import bm25s
+except ImportError:
+    bm25s = None
+
+try:
+    # pyahocorasick：多词条单遍扫描，上下文选择的关键词计分用
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 VECTOR_DB_PATH = "./vector_db"
 EMBEDDING_MODEL_NAME = "./models/bge-large-zh-v1.5"
 LLM_MODEL_PATH = "./models/Qwen2.5-7B-Instruct"
@@ -82,6 +96,72 @@ FEW_SHOT_EXAMPLES = [
 ]
 
 
+# BM25S索引的持久化位置：冷启动直接加载，不重复分词建矩阵
+# （随索引存一份语料指纹，语料变化时自动重建）
+BM25S_INDEX_PATH = os.path.join(VECTOR_DB_PATH, "bm25s_index")
+
+
+def _corpus_fingerprint(docs: List[Document]) -> str:
+    """语料内容指纹：每篇取长度+首尾片段喂blake2b，单遍但不扫全文。
+    文档数相同的重导入/重排也会改变指纹，只数num_docs则察觉不到"""
+    h = hashlib.blake2b(digest_size=16)
+    for d in docs:
+        c = d.page_content
+        h.update(f"{len(c)}\x1f{c[:48]}\x1f{c[-48:]}\x1e".encode("utf-8", "ignore"))
+    return h.hexdigest()
+
+
+class BM25SRetriever:
+    """BM25S稀疏检索器：查询打分是稀疏矩阵行操作，而非逐文档Python循环"""
+
+    def __init__(self, docs: List[Document], k: int = 6, index_dir: str = None):
+        self.k = k
+        self.docs = docs
+        self.bm25 = None
+        meta_path = os.path.join(index_dir, "corpus_meta.json") if index_dir else None
+        fingerprint = _corpus_fingerprint(docs)
+
+        if index_dir and os.path.exists(index_dir):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                # 指纹对不上说明语料变过（上传新文档/压缩重排——哪怕
+                # 文档数恰好相同），落盘索引的文档id会映射到错误的文档，
+                # 必须重建
+                if (
+                    meta.get("num_docs") == len(docs)
+                    and meta.get("fingerprint") == fingerprint
+                ):
+                    self.bm25 = bm25s.BM25.load(index_dir)
+            except Exception:
+                self.bm25 = None  # 索引损坏/版本不兼容则重建
+
+        if self.bm25 is None:
+            tokens = bm25s.tokenize(
+                [d.page_content for d in docs], stopwords="zh", show_progress=False
+            )
+            self.bm25 = bm25s.BM25()
+            self.bm25.index(tokens, show_progress=False)
+            if index_dir:
+                try:
+                    self.bm25.save(index_dir)
+                    with open(meta_path, "w", encoding="utf-8") as f:
+                        json.dump(
+                            {"num_docs": len(docs), "fingerprint": fingerprint}, f
+                        )
+                except Exception:
+                    pass  # 存不上只影响下次冷启动速度
+
+    def invoke(self, query: str) -> List[Document]:
+        q_tokens = bm25s.tokenize(query, stopwords="zh", show_progress=False)
+        ids, _ = self.bm25.retrieve(
+            q_tokens, k=min(self.k, len(self.docs)), show_progress=False
+        )
+        # 防御性过滤：即使指纹校验漏掉了错位，也不越界
+        n = len(self.docs)
+        return [self.docs[i] for i in map(int, ids[0]) if 0 <= i < n]
+
+
 class EnsembleRetriever:
     """混合检索器：向量检索 + BM25"""
     def __init__(self, retrievers, weights=None):
@@ -89,16 +169,24 @@ class EnsembleRetriever:
         self.weights = weights or [1.0] * len(retrievers)
 
     def invoke(self, query: str) -> List[Document]:
-        all_docs = []
+        # 加权RRF融合：score += w / (60 + rank)，单遍扫描每路结果。
+        # 旧实现按权重把文档引用复制10倍再用dict去重，既有O(10N)的
+        # 列表膨胀，又对同一长文本反复求哈希
+        scores: Dict[str, float] = {}
+        objs: Dict[str, Document] = {}
         for retriever, w in zip(self.retrievers, self.weights):
             try:
                 docs = retriever.invoke(query)
             except Exception:
                 docs = retriever.get_relevant_documents(query)
-            all_docs.extend(docs * int(w * 10))
+            for rank, d in enumerate(docs):
+                key = d.page_content  # str哈希算一次后缓存在对象上
+                if key not in objs:
+                    objs[key] = d
+                scores[key] = scores.get(key, 0.0) + w / (60.0 + rank)
 
-        unique_docs = {d.page_content: d for d in all_docs}
-        return list(unique_docs.values())
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        return [objs[key] for key, _ in ranked]
 
 @st.cache_resource
 def load_retriever(db_path, model_name):
@@ -128,9 +216,13 @@ def load_retriever(db_path, model_name):
                 docs = [Document(page_content=doc, metadata=meta) 
                        for doc, meta in zip(all_data['documents'], 
                                            all_data.get('metadatas', [{}]*len(all_data['documents'])))]
-                bm25_retriever = BM25Retriever.from_documents(docs)
-                bm25_retriever.k = 6
-                
+                if bm25s is not None:
+                    bm25_retriever = BM25SRetriever(docs, k=6, index_dir=BM25S_INDEX_PATH)
+                else:
+                    # 未安装bm25s时退回rank_bm25实现
+                    bm25_retriever = BM25Retriever.from_documents(docs)
+                    bm25_retriever.k = 6
+
                 ensemble_retriever = EnsembleRetriever(
                     retrievers=[vector_retriever, bm25_retriever],
                     weights=[0.6, 0.4]
@@ -143,9 +235,12 @@ def load_retriever(db_path, model_name):
         return vector_retriever
 
 
-@st.cache_resource
+# cache_resource是给模型/连接这类全局单例用的：按查询串缓存会把
+# 每个问过的问题永久留在Streamlit资源缓存里。纯函数用lru_cache，
+# 容量有界且命中开销只有一次字典查找
+@lru_cache(maxsize=512)
 def generate_queries(original_query, num_queries=2):
-    """智能查询扩展"""
+    """智能查询扩展（返回tuple，缓存命中共享同一对象也不怕被改）"""
     queries = [original_query]
     
     # 补充疑问词
@@ -162,8 +257,8 @@ def generate_queries(original_query, num_queries=2):
     
     if not has_domain and len(queries) < num_queries + 1:
         queries.append(f"深度学习中的{original_query}")
-    
-    return queries[:num_queries + 1]
+
+    return tuple(queries[:num_queries + 1])
 
 
 def smart_context_selection(docs, query, max_docs=4):
@@ -172,13 +267,25 @@ def smart_context_selection(docs, query, max_docs=4):
         return docs
     
     query_terms = set(query.lower().split())
-    
+
+    automaton = None
+    if ahocorasick is not None and query_terms:
+        # 词条自动机建一次，每篇文档单遍扫描计数
+        automaton = ahocorasick.Automaton()
+        for term in query_terms:
+            automaton.add_word(term, term)
+        automaton.make_automaton()
+
     scored_docs = []
     for doc in docs:
         content_lower = doc.page_content.lower()
-        
+
         # 1. 关键词匹配得分
-        keyword_score = sum(1 for term in query_terms if term in content_lower)
+        if automaton is not None:
+            # 每个词条只计一次（与substring版语义一致），不按出现次数累加
+            keyword_score = len({term for _, term in automaton.iter(content_lower)})
+        else:
+            keyword_score = sum(1 for term in query_terms if term in content_lower)
         
         # 2. 文档长度得分（更完整的信息）
         length_score = min(len(doc.page_content) / 1000, 2.0)
@@ -225,10 +332,11 @@ def retrieve_with_enhancements(retriever, query, k=4, enable_expansion=True):
             docs = retriever.invoke(q)
             
             for doc in docs:
-                content_hash = hashlib.md5(doc.page_content.encode()).hexdigest()
-                if content_hash not in seen_content:
+                # 内容字符串本身做去重key，免掉MD5计算和hex串分配
+                content = doc.page_content
+                if content not in seen_content:
                     all_docs.append(doc)
-                    seen_content.add(content_hash)
+                    seen_content.add(content)
         
         final_docs = smart_context_selection(all_docs, query, max_docs=k)
         
@@ -250,11 +358,9 @@ def retrieve_with_enhancements(retriever, query, k=4, enable_expansion=True):
         st.error(f"检索出错: {e}")
         return "", [], []
 
-def build_enhanced_prompt(context, question, dialogue_history=None, 
-                         use_fewshot=True, use_multi_turn=True):
-    """构建优化的prompt"""
-    
-    system_prompt = """你是一位经验丰富的机器学习与深度学习专家教师。你的使命是帮助学习者深入理解复杂的技术概念。
+# prompt的静态前缀在导入时拼好：系统消息和few-shot块每轮字节不变，
+# 远端vLLM/TGI的自动前缀缓存才有机会命中；也省掉每次调用的字符串拼接
+_SYSTEM_PROMPT = """你是一位经验丰富的机器学习与深度学习专家教师。你的使命是帮助学习者深入理解复杂的技术概念。
 
 **教学原则：**
 
@@ -285,13 +391,20 @@ def build_enhanced_prompt(context, question, dialogue_history=None,
 
 **回答风格：** 专业而友好，像一位耐心的导师与学生面对面交流。"""
 
-    # Few-shot示例
-    fewshot_text = ""
-    if use_fewshot:
-        fewshot_text = "\n\n**参考示例：**\n"
-        for i, example in enumerate(FEW_SHOT_EXAMPLES[:2], 1):
-            fewshot_text += f"\n【示例 {i}】\n问：{example['question']}\n答：{example['answer'][:300]}...\n"
-    
+_SYSTEM_MSG = {"role": "system", "content": _SYSTEM_PROMPT}
+
+_FEWSHOT_BLOCK = "\n\n**参考示例：**\n" + "".join(
+    f"\n【示例 {i}】\n问：{example['question']}\n答：{example['answer'][:300]}...\n"
+    for i, example in enumerate(FEW_SHOT_EXAMPLES[:2], 1)
+)
+
+
+def build_enhanced_prompt(context, question, dialogue_history=None,
+                         use_fewshot=True, use_multi_turn=True):
+    """构建优化的prompt（静态前缀复用常量，可变内容集中在消息尾部）"""
+
+    fewshot_text = _FEWSHOT_BLOCK if use_fewshot else ""
+
     # 对话历史
     history_section = ""
     if use_multi_turn and dialogue_history:
@@ -309,10 +422,10 @@ def build_enhanced_prompt(context, question, dialogue_history=None,
 请基于参考资料，提供一个专业、准确且易于理解的回答。"""
 
     messages = [
-        {"role": "system", "content": system_prompt},
+        _SYSTEM_MSG,
         {"role": "user", "content": user_message}
     ]
-    
+
     return messages
 
 def save_feedback(question, answer, feedback_type, comment=""):
@@ -599,18 +712,30 @@ def main():
                     response_placeholder = st.empty()
 
                     try:
-                        # 直接调用远程 LLM，一次性拿到完整回答
-                        full_response = chat_completion(
-                            messages,
-                            temperature=0.7,   # 你可以用界面上的参数替代
-                            max_tokens=1024
+                        # 流式调用远程 LLM：首token到达即开始渲染，
+                        # 不用对着spinner等整段回答生成完
+                        full_response = st.write_stream(
+                            chat_completion_stream(
+                                messages,
+                                temperature=0.7,   # 你可以用界面上的参数替代
+                                max_tokens=1024
+                            )
                         )
-                        response_placeholder.markdown(full_response)
                         status_container.empty()
-                    except LLMClientError as e:
-                        st.error(f"❌ 生成出错: {e}")
-                        full_response = "抱歉，生成时遇到问题。"
-                        response_placeholder.markdown(full_response)
+                    except LLMClientError:
+                        # 流式失败（如网关不支持SSE）退回一次性调用
+                        try:
+                            full_response = chat_completion(
+                                messages,
+                                temperature=0.7,
+                                max_tokens=1024
+                            )
+                            response_placeholder.markdown(full_response)
+                            status_container.empty()
+                        except LLMClientError as e:
+                            st.error(f"❌ 生成出错: {e}")
+                            full_response = "抱歉，生成时遇到问题。"
+                            response_placeholder.markdown(full_response)
                 
                 # 显示来源和反馈
                 if sources:
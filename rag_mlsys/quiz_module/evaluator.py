@@ -4,6 +4,8 @@ from typing import List, Dict, Any, Optional
 from collections import Counter
 import re
 
+import numpy as np
+
 
 def grade_quiz(questions: List[Dict[str, Any]], user_answers_list: List[Optional[str]]) -> Dict[str, Any]:
     """
@@ -51,16 +53,18 @@ def grade_quiz(questions: List[Dict[str, Any]], user_answers_list: List[Optional
             user_answers_map[i] = user_ans_index
         except ValueError:
             # 容错处理：尝试模糊匹配（去除选项前缀 "A. "）
-            matched = False
+            # 清理后的选项建一次索引表，O(options)线性扫描变一次哈希查找；
+            # 倒序建表保证重复选项仍命中靠前的那个
             cleaned_user_ans = _clean_option_text(user_ans_str)
-            
-            for idx, opt in enumerate(q['options']):
-                if _clean_option_text(opt) == cleaned_user_ans:
-                    user_answers_map[i] = idx
-                    matched = True
-                    break
-            
-            if not matched:
+            cleaned_index = {
+                _clean_option_text(opt): idx
+                for idx, opt in reversed(list(enumerate(q['options'])))
+            }
+
+            matched_idx = cleaned_index.get(cleaned_user_ans)
+            if matched_idx is not None:
+                user_answers_map[i] = matched_idx
+            else:
                 # 实在匹配不到，标记为未答
                 user_answers_map[i] = -1
                 unanswered_count += 1
@@ -75,14 +79,18 @@ def grade_quiz(questions: List[Dict[str, Any]], user_answers_list: List[Optional
     return result
 
 
+# 选项前缀 "A. " 的清理正则：模块级编译一次，不走re.sub的每次缓存查找
+_OPT_PREFIX = re.compile(r'^[A-D]\.\s*')
+
+
 def _clean_option_text(option: str) -> str:
     """
     清理选项文本（移除 A. B. True False 等前缀）
     """
-    # 移除常见前缀
-    option = re.sub(r'^[A-D]\.\s*', '', option)
-    option = option.strip()
-    return option
+    # 标准 "X. " 前缀直接切片，完全绕开正则引擎
+    if len(option) >= 2 and option[1] == '.' and option[0] in 'ABCD':
+        return option[2:].strip()
+    return _OPT_PREFIX.sub('', option).strip()
 
 
 def calculate_score(user_answers: Dict[int, int], questions: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -98,37 +106,40 @@ def calculate_score(user_answers: Dict[int, int], questions: List[Dict[str, Any]
         详细的评分报告字典
     """
     total = len(questions)
-    correct = 0
-    wrong = 0
+
+    # 判分走numpy布尔掩码：比较/计数在C层一次完成，
+    # Python层只剩最后组装一遍results
+    ua = np.fromiter((user_answers.get(i, -1) for i in range(total)), np.int32, total)
+    ca = np.fromiter((q["correct_answer_index"] for q in questions), np.int32, total)
+
+    answered_mask = ua != -1
+    correct_mask = (ua == ca) & answered_mask
+    wrong_mask = answered_mask & ~correct_mask
+
+    correct = int(correct_mask.sum())
+    wrong = int(wrong_mask.sum())
+
     results = []
     wrong_types = []  # 记录错题类型（用于知识盲区分析）
-    
+
     for i, question in enumerate(questions):
-        user_answer_index = user_answers.get(i, -1)
-        correct_answer_index = question["correct_answer_index"]
-        
-        # 判断正误
-        is_correct = (user_answer_index == correct_answer_index) and (user_answer_index != -1)
-        
-        if is_correct:
-            correct += 1
-        elif user_answer_index != -1:
-            wrong += 1
+        is_correct = bool(correct_mask[i])
+        if wrong_mask[i]:
             wrong_types.append(question.get('type', 'unknown'))
-        
+
         # 存储详细结果
         results.append({
             "question_index": i,
             "question": question["question"],
             "type": question.get("type", "unknown"),
             "options": question["options"],
-            "user_answer": user_answer_index,
-            "correct_answer": correct_answer_index,
+            "user_answer": int(ua[i]),
+            "correct_answer": int(ca[i]),
             "is_correct": is_correct,
-            "is_unanswered": (user_answer_index == -1),
+            "is_unanswered": not answered_mask[i],
             "explanation": question["explanation"]
         })
-    
+
     # 计算得分
     score_percentage = (correct / total * 100) if total > 0 else 0
     
@@ -154,13 +165,19 @@ def _calculate_statistics(results: List[Dict], wrong_types: List[str]) -> Dict[s
     """
     计算统计信息
     """
-    # 按题型统计
-    choice_correct = sum(1 for r in results if r['type'] == 'choice' and r['is_correct'])
-    choice_total = sum(1 for r in results if r['type'] == 'choice')
-    
-    boolean_correct = sum(1 for r in results if r['type'] == 'boolean' and r['is_correct'])
-    boolean_total = sum(1 for r in results if r['type'] == 'boolean')
-    
+    # 按题型统计：题型/正误转成数组后，四个计数都是掩码求和，
+    # 不再对同一列表跑四遍Python循环
+    n = len(results)
+    tp = np.array([r['type'] for r in results]) if results else np.empty(0, dtype=str)
+    cm = np.fromiter((r['is_correct'] for r in results), bool, n)
+
+    choice_mask = tp == 'choice'
+    boolean_mask = tp == 'boolean'
+    choice_total = int(choice_mask.sum())
+    choice_correct = int((choice_mask & cm).sum())
+    boolean_total = int(boolean_mask.sum())
+    boolean_correct = int((boolean_mask & cm).sum())
+
     # 错题类型分布
     wrong_type_count = Counter(wrong_types)
     
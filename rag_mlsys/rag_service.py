@@ -2,7 +2,6 @@
 from __future__ import annotations
 import torch
 import os
-import hashlib
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Tuple, Any
 
@@ -11,13 +10,51 @@ from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.retrievers import BM25Retriever
 
-from llm_client import chat_completion, LLMClientError  
+from llm_client import chat_completion, LLMClientError
+
+try:
+    # pyahocorasick：多词条单遍扫描的状态机，用于上下文选择的关键词计分
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 
 VECTOR_DB_PATH = "./vector_db"
 EMBEDDING_MODEL_NAME = "./models/bge-large-zh-v1.5"
 
 
+def _load_faiss_read_index(db_path: str, embedding_model) -> Optional[Any]:
+    """
+    尝试加载FAISS只读镜像索引（mmap方式，不把向量整体读进内存）。
+
+    大库场景下Chroma的反序列化是读路径瓶颈，若目录下存在离线构建的
+    index.faiss/index.pkl镜像，无过滤条件的向量检索就走FAISS；
+    镜像不存在或加载失败时返回None，检索完全退回Chroma。
+    """
+    index_path = os.path.join(db_path, "index.faiss")
+    store_path = os.path.join(db_path, "index.pkl")
+    if not (os.path.exists(index_path) and os.path.exists(store_path)):
+        return None
+    try:
+        import pickle
+        import faiss
+        from langchain_community.vectorstores import FAISS as FAISSVectorStore
+
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        with open(store_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        print("✓ 已加载FAISS镜像索引（mmap只读），无过滤检索走FAISS")
+        return FAISSVectorStore(
+            embedding_function=embedding_model,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+    except Exception as e:
+        print(f"⚠️ FAISS镜像索引加载失败，检索退回Chroma: {e}")
+        return None
+
+
 @dataclass
 class RetrievedChunk:
     content: str
@@ -26,8 +63,19 @@ class RetrievedChunk:
 
 
 class EnsembleRetriever:
-    def __init__(self, db: Chroma, k: int = 6):
+    def __init__(
+        self,
+        db: Chroma,
+        k: int = 6,
+        read_store: Optional[Any] = None,
+        embedding_model: Optional[Any] = None,
+    ):
+        self.db = db
         self.k = k
+        # 可选的FAISS只读镜像：无过滤检索优先走它
+        self.read_store = read_store
+        # 批量检索时直接用它一次前向编码所有扩展查询
+        self.embedding_model = embedding_model
         self.vector_retriever = db.as_retriever(
             search_type="similarity",
             search_kwargs={"k": k},
@@ -80,12 +128,18 @@ class EnsembleRetriever:
                 )
             else:
                 docs.extend(self._call_retriever(self.vector_retriever, query))
+        elif self.read_store is not None:
+            # FAISS不支持元数据预过滤，只有无过滤的检索才走镜像
+            docs.extend(self.read_store.similarity_search(query, k=top_k))
         else:
             docs.extend(self._call_retriever(self.vector_retriever, query))
 
         if self.bm25_retriever and not filters:
             docs.extend(self._call_retriever(self.bm25_retriever, query))
 
+        return self._dedup_truncate(docs)
+
+    def _dedup_truncate(self, docs: List[Document]) -> List[Document]:
         unique: Dict[str, Document] = {}
         for d in docs:
             key = d.page_content.strip()
@@ -93,6 +147,46 @@ class EnsembleRetriever:
                 unique[key] = d
         return list(unique.values())[: self.k]
 
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        filters: Optional[Dict[str, Any]] = None,
+        k: Optional[int] = None,
+    ) -> List[List[Document]]:
+        """
+        批量检索：所有扩展查询合并成一次编码器前向 + 一次Chroma批量查询。
+        BERT类模型强batch友好，N≤8个查询的编码耗时与单个几乎相同；
+        没有embedding模型可用时退化为逐查询retrieve。
+        """
+        top_k = k or self.k
+        if self.embedding_model is None or len(queries) <= 1:
+            return [self.retrieve(q, filters=filters, k=k) for q in queries]
+
+        try:
+            qvecs = self.embedding_model.embed_documents(list(queries))
+            res = self.db._collection.query(
+                query_embeddings=qvecs,
+                n_results=top_k,
+                where=filters or None,
+                include=["documents", "metadatas"],
+            )
+        except Exception as e:
+            print(f"⚠️ 批量向量检索失败，退回逐查询检索: {e}")
+            return [self.retrieve(q, filters=filters, k=k) for q in queries]
+
+        batched: List[List[Document]] = []
+        for qi, (docs_i, metas_i) in enumerate(
+            zip(res.get("documents") or [], res.get("metadatas") or [])
+        ):
+            docs = [
+                Document(page_content=content, metadata=meta or {})
+                for content, meta in zip(docs_i, metas_i)
+            ]
+            if self.bm25_retriever and not filters:
+                docs.extend(self._call_retriever(self.bm25_retriever, queries[qi]))
+            batched.append(self._dedup_truncate(docs))
+        return batched
+
 
 def generate_queries(original_query: str, num_queries: int = 2) -> List[str]:
     """智能查询扩展（从你现有 module_rag_assistant 中提取出来的逻辑）:contentReference[oaicite:4]{index=4}"""
@@ -120,9 +214,22 @@ def smart_context_selection(docs: List[Document], query: str, max_docs: int = 4)
     query_terms = set(query.lower().split())
     scored_docs = []
 
+    automaton = None
+    if ahocorasick is not None and query_terms:
+        # 词条自动机按查询建一次，每篇文档只需O(|doc|)的单遍状态机扫描，
+        # 替代每词条一次的substring搜索
+        automaton = ahocorasick.Automaton()
+        for term in query_terms:
+            automaton.add_word(term, term)
+        automaton.make_automaton()
+
     for doc in docs:
         content_lower = doc.page_content.lower()
-        keyword_score = sum(1 for term in query_terms if term in content_lower)
+        if automaton is not None:
+            # 每个词条只计一次（与substring版语义一致），不按出现次数累加
+            keyword_score = len({term for _, term in automaton.iter(content_lower)})
+        else:
+            keyword_score = sum(1 for term in query_terms if term in content_lower)
         length_score = min(len(doc.page_content) / 1000, 2.0)
         diversity_score = 1.0
         total_score = keyword_score * 2 + length_score + diversity_score
@@ -204,7 +311,15 @@ class RAGService:
             embedding_function=self.embedding_model,
         )
 
-        self.retriever = EnsembleRetriever(self.db, k=k)
+        # 只读FAISS镜像（可选）：Chroma仍是写路径的唯一数据源
+        self.vector_store_read = _load_faiss_read_index(db_path, self.embedding_model)
+
+        self.retriever = EnsembleRetriever(
+            self.db,
+            k=k,
+            read_store=self.vector_store_read,
+            embedding_model=self.embedding_model,
+        )
 
     def retrieve_with_enhancements(
         self,
@@ -217,13 +332,14 @@ class RAGService:
         seen_content = set()
 
         queries = generate_queries(query, num_queries=2) if enable_expansion else [query]
-        for q in queries:
-            docs = self.retriever.retrieve(q, filters=filters, k=k)
+        for docs in self.retriever.retrieve_batch(queries, filters=filters, k=k):
             for doc in docs:
-                content_hash = hashlib.md5(doc.page_content.encode()).hexdigest()
-                if content_hash not in seen_content:
+                # 直接以内容字符串为去重key：str哈希在对象上算一次就缓存，
+                # 免掉MD5块压缩和十六进制串分配
+                content = doc.page_content
+                if content not in seen_content:
                     all_docs.append(doc)
-                    seen_content.add(content_hash)
+                    seen_content.add(content)
 
         final_docs = smart_context_selection(all_docs, query, max_docs=k)
 